@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.retrieve import (
+    configure_query_cache, load_index, load_chunks_with_metadata, retrieve_passages,
+    retrieve_passages_with_keywords, RETRIEVAL_RESOURCES
+)
+from utils.resources import registry
+from utils import metrics
+
+MODES = ["unfiltered", "title_filtered", "genre_filtered", "keyword"]
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if platform.system() == "Darwin" else peak / 2**10
+
+def rss_mb():
+    """
+    Current resident set size of this process in MB, or None where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def synthetic_queries(n, seed=0, min_words=6, max_words=12):
+    """
+    Sample word windows from random chunks as synthetic queries.
+
+    Args:
+        n (int): Number of queries.
+        seed (int): Random seed, so runs compare the same queries.
+        min_words (int): Minimum words per query.
+        max_words (int): Maximum words per query.
+
+    Returns:
+        list: Query strings.
+    """
+    rng = random.Random(seed)
+    chunks_with_metadata = load_chunks_with_metadata()
+    queries = []
+    for _ in range(n):
+        words = chunks_with_metadata.contents(rng.randrange(len(chunks_with_metadata))).split()
+        length = rng.randint(min_words, max_words)
+        start = rng.randrange(max(1, len(words) - length))
+        queries.append(" ".join(words[start:start + length]))
+    return queries
+
+def load_query_sets(synthetic=200, limit=None):
+    """
+    Returns:
+        dict: Query set name to list of query strings.
+    """
+    query_sets = {}
+    for name, path in (("line_loc", "eval/line_loc.json"), ("understanding", "eval/understanding.json")):
+        with open(path, "r", encoding="utf-8") as file:
+            query_sets[name] = [qa["question"] for qa in json.load(file)][:limit]
+    if synthetic:
+        query_sets["synthetic"] = synthetic_queries(synthetic)[:limit]
+    return query_sets
+
+def run_query(mode, query, i, top_k=5):
+    """
+    Run one query through a retrieval mode, timing each stage.
+
+    Filtered modes rotate through the corpus titles and genres so every filter is exercised.
+    The keyword mode is the app's path, `retrieve_passages_with_keywords`: keyword detection and
+    line lookup, then hybrid dense + BM25 search when no quoted line is found. Stages are the
+    metrics spans recorded inside the retrieval functions, so the real code paths are timed.
+
+    Returns:
+        dict: Milliseconds per span name (e.g. "encode_queries", "faiss_search", "bm25_search",
+        "materialize"), plus "total".
+    """
+    filter_title = filter_genre = None
+    if mode in ("title_filtered", "genre_filtered"):
+        chunks_with_metadata = load_chunks_with_metadata()
+        if mode == "title_filtered":
+            filter_title = chunks_with_metadata.titles[i % len(chunks_with_metadata.titles)]
+        else:
+            filter_genre = chunks_with_metadata.genres[i % len(chunks_with_metadata.genres)]
+
+    start = time.perf_counter()
+    with metrics.request() as trace:
+        if mode == "keyword":
+            results = retrieve_passages_with_keywords(query, top_k)
+        else:
+            results = retrieve_passages(query, top_k, filter_title=filter_title, filter_genre=filter_genre)
+        # Touch the contents so lazily stored text is actually decoded
+        for result in results:
+            len(result["contents"])
+    total = (time.perf_counter() - start) * 1000
+
+    timings = {}
+    for span in trace.spans:
+        timings[span["name"]] = timings.get(span["name"], 0.0) + span["ms"]
+    timings["total"] = total
+    return timings
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+        "count": int(len(values))
+    }
+
+def benchmark_mode(mode, queries, concurrency_levels, top_k=5):
+    """
+    Measure stage latency percentiles (sequentially) and throughput at each concurrency level.
+
+    Returns:
+        dict: "latency_ms" per stage, "qps" per concurrency level, and the memory the mode added:
+        "rss_delta_mb" (resident set growth, None without /proc) and "peak_rss_growth_mb" (how far
+        it raised the process peak; 0 when earlier modes already peaked higher).
+    """
+    rss_before, peak_before = rss_mb(), peak_rss_mb()
+    stage_times = {}
+    for i, query in enumerate(queries):
+        for name, ms in run_query(mode, query, i, top_k=top_k).items():
+            stage_times.setdefault(name, []).append(ms)
+
+    throughput = {}
+    for concurrency in concurrency_levels:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda item: run_query(mode, item[1], item[0], top_k=top_k), enumerate(queries)))
+            elapsed = time.perf_counter() - start
+        throughput[str(concurrency)] = len(queries) / elapsed
+
+    return {
+        "latency_ms": {name: percentiles(times) for name, times in stage_times.items()},
+        "qps": throughput,
+        "rss_delta_mb": None if rss_before is None else rss_mb() - rss_before,
+        "peak_rss_growth_mb": peak_rss_mb() - peak_before
+    }
+
+def run_benchmark(modes=MODES, concurrency_levels=(1, 2, 4, 8), synthetic=200, limit=None, top_k=5,
+                  use_query_cache=False):
+    """
+    Benchmark every retrieval mode on every query set.
+
+    Args:
+        modes (list): Retrieval modes, from `MODES`.
+        concurrency_levels (iterable): Thread counts for the throughput runs.
+        synthetic (int): Number of synthetic queries sampled from the corpus (0 to skip).
+        limit (int): Optional cap on queries per set.
+        top_k (int): Number of results per query.
+        use_query_cache (bool): Keep the query-embedding cache; off by default so encode time is real.
+
+    Returns:
+        dict: Machine-readable results.
+    """
+    if not use_query_cache:
+        configure_query_cache(max_size=0)
+    # Stage timings come from the spans in the retrieval code
+    metrics.enable()
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    for name in RETRIEVAL_RESOURCES:
+        registry.get(name)
+    load_seconds = time.perf_counter() - start
+
+    query_sets = load_query_sets(synthetic=synthetic, limit=limit)
+    # Warm up lazily initialized code paths (BLAS threads, mmap pages) before timing
+    for mode in modes:
+        run_query(mode, query_sets["line_loc"][0], 0, top_k=top_k)
+
+    index = load_index()
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "modes": list(modes), "concurrency_levels": list(concurrency_levels), "top_k": top_k,
+            "synthetic": synthetic, "limit": limit, "use_query_cache": use_query_cache,
+            "index_type": type(index).__name__, "ntotal": int(index.ntotal)
+        },
+        "load": {
+            "seconds": load_seconds,
+            "per_resource_seconds": registry.report(),
+            "peak_rss_mb_before": rss_before,
+            "peak_rss_mb_after": peak_rss_mb()
+        },
+        "results": {}
+    }
+
+    for set_name, queries in query_sets.items():
+        for mode in modes:
+            print(f"Benchmarking {mode} on {set_name} ({len(queries)} queries)...")
+            results["results"].setdefault(set_name, {})[mode] = benchmark_mode(mode, queries, concurrency_levels, top_k)
+
+    return results
+
+def print_summary(results):
+    print(f"{'Set':<14} {'Mode':<16} {'p50 ms':<9} {'p95 ms':<9} {'p99 ms':<9} QPS by concurrency")
+    for set_name, modes in results["results"].items():
+        for mode, result in modes.items():
+            total = result["latency_ms"]["total"]
+            qps = ", ".join(f"{level}: {value:.1f}" for level, value in result["qps"].items())
+            print(f"{set_name:<14} {mode:<16} {total['p50']:<9.2f} {total['p95']:<9.2f} {total['p99']:<9.2f} {qps}")
+    print(f"Load time: {results['load']['seconds']:.2f}s, peak RSS: {peak_rss_mb():.0f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency, throughput and memory.")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--synthetic", type=int, default=200, help="Synthetic queries sampled from the corpus.")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum queries per query set.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--use-query-cache", action="store_true",
+                        help="Keep the query-embedding cache (repeated queries then skip the encoder).")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        modes=args.modes, concurrency_levels=args.concurrency, synthetic=args.synthetic,
+        limit=args.limit, top_k=args.top_k, use_query_cache=args.use_query_cache
+    )
+    print_summary(results)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
@@ -1,40 +1,63 @@
+import os
 import json
-from utils.retrieve import retrieve_passages_with_keywords, embedder, index, chunks_with_metadata
-from utils.openai import generate_answer_with_gpt
-from utils.llama import generator_pipeline
-
-def retrieve_passages_eval(query, top_k=5):
-    query_embedding = embedder.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(query_embedding, top_k)
-
-    # Retrieve actual text
-    results = []
-    for i, idx in enumerate(indices[0]):
-        result = chunks_with_metadata[idx]
-        results.append({
-            "rank": i + 1,
-            "id": result["id"],
-            "name": result["name"],
-            "contents": result["contents"],
-            "distance": distances[0][i]
-        })
-        
-    print(f"Query: {query}")
-    print(f"Top {top_k} results:")
-    for res in results:
-        print(f"Rank: {res['rank']}, ID: {res['id']}, Name: {res['name']}, Distance: {res['distance']}")
-    print()
+import time
+import argparse
+import faiss
+from utils.indexing import build_faiss_index, configure_index
+from utils.retrieve import (
+    retrieve_batch, retrieve_passages_with_keywords, encode_queries, load_index, load_chunks_with_metadata
+)
+from utils.rerank import get_reranker
+from utils.quantized_store import CODE_TYPES, QuantizedIndex, build_quantized_store
+from utils.async_generation import generate_answers
+from utils.llama import get_generator_pipeline
+from utils.resources import registry
+from utils.retrieval_client import RetrievalClient
 
-    return results
+# Set from --retrieval-service: batched retrieval then runs in service.py instead of in this process
+retrieval_client = None
 
-def compute_metrics(dataset, retriever, top_k=5):
+def retrieve_passages_eval(queries, top_k=5):
+    """
+    Dense-only baseline over the whole index, with one batched encode and one search for all queries.
+    """
+    index = load_index()
+    chunks_with_metadata = load_chunks_with_metadata()
+    query_embeddings = encode_queries(queries)
+    distances, indices = index.search(query_embeddings, top_k)
+
+    all_results = []
+    for query, query_distances, query_indices in zip(queries, distances, indices):
+        # Retrieve actual text
+        results = []
+        for i, idx in enumerate(query_indices):
+            result = chunks_with_metadata[idx]
+            results.append({
+                "rank": i + 1,
+                "id": result["id"],
+                "name": result["name"],
+                "contents": result["contents"],
+                "distance": query_distances[i]
+            })
+
+        print(f"Query: {query}")
+        print(f"Top {top_k} results:")
+        for res in results:
+            print(f"Rank: {res['rank']}, ID: {res['id']}, Name: {res['name']}, Distance: {res['distance']}")
+        print()
+        all_results.append(results)
+
+    return all_results
+
+def compute_metrics(dataset, retriever, top_k=5, batch_size=64):
     """
     Compute Recall@k and MRR for the retrieval system.
 
     Args:
         dataset (list): List of Q&A pairs (questions and answers).
-        retriever (function): Function to retrieve passages.
+        retriever (function): Batch retriever mapping a list of questions to a list of result lists.
         top_k (int): Number of top passages to retrieve.
+        batch_size (int): Number of questions retrieved per call.
 
     Returns:
         dict: Metrics (Recall@k, MRR).
@@ -43,11 +66,13 @@ def compute_metrics(dataset, retriever, top_k=5):
     recall_at_k = 0
     reciprocal_ranks = []
 
-    for qa in dataset:
-        question = qa["question"]
-        ground_truth = qa["answer"]
+    retrieved = []
+    for start in range(0, total_questions, batch_size):
+        batch = dataset[start:start + batch_size]
+        retrieved.extend(retriever([qa["question"] for qa in batch], top_k=top_k))
 
-        retrieved_passages = retriever(question, top_k=top_k)
+    for qa, retrieved_passages in zip(dataset, retrieved):
+        ground_truth = qa["answer"]
 
         # Check if the ground truth is in the top-k results
         found = False
@@ -70,8 +95,10 @@ def compute_metrics(dataset, retriever, top_k=5):
         "MRR": mrr
     }
 
-def retriever(query, top_k=5):
-    return retrieve_passages_with_keywords(query, top_k=top_k)
+def retriever(queries, top_k=5):
+    if retrieval_client is not None:
+        return retrieval_client.retrieve_batch(queries, top_k=top_k)
+    return retrieve_batch(queries, top_k=top_k)
 
 def evaluate_and_print(model, dataset_path, top_k=5):
     """
@@ -85,11 +112,12 @@ def evaluate_and_print(model, dataset_path, top_k=5):
     with open(dataset_path, "r", encoding="utf-8") as file:
         dataset = json.load(file)
 
-    for qa in dataset:
+    # Retrieve relevant passages for every question in one batch
+    all_retrieved = retriever([qa["question"] for qa in dataset], top_k=top_k)
+
+    for qa, retrieved_passages in zip(dataset, all_retrieved):
         question = qa["question"]
 
-        # Retrieve relevant passages
-        retrieved_passages = retriever(question, top_k=top_k)
         # retrieved_texts = [passage["contents"] for passage in retrieved_passages]
         retrieved_ids = [passage["id"] for passage in retrieved_passages]
 
@@ -110,32 +138,276 @@ def evaluate_and_print(model, dataset_path, top_k=5):
         print(f"Generated Answer: {generated_answer}")
         print("-" * 80)
 
+def evaluate_gpt_concurrently(dataset_path, top_k=5, **client_kwargs):
+    """
+    Evaluate GPT on a dataset with concurrent, rate-limited requests and print the outputs.
+
+    Args:
+        dataset_path (str): Path to the QA dataset (JSON file).
+        top_k (int): Number of top passages to retrieve.
+        **client_kwargs: Passed to `AsyncGenerationClient` (base_url, max_concurrency, requests_per_second, ...).
+    """
+    with open(dataset_path, "r", encoding="utf-8") as file:
+        dataset = json.load(file)
+
+    questions = [qa["question"] for qa in dataset]
+    all_retrieved = retriever(questions, top_k=top_k)
+
+    start = time.perf_counter()
+    answers = generate_answers(questions, all_retrieved, **client_kwargs)
+    elapsed = time.perf_counter() - start
+
+    for question, retrieved_passages, answer in zip(questions, all_retrieved, answers):
+        if isinstance(answer, Exception):
+            answer = f"[generation failed: {answer}]"
+        print(f"Question: {question}")
+        print(f"Context: {' '.join(passage['id'] for passage in retrieved_passages)}")
+        print(f"Generated Answer: {answer.strip()}")
+        print("-" * 80)
+
+    failures = sum(isinstance(answer, Exception) for answer in answers)
+    print(f"Generated {len(answers) - failures}/{len(answers)} answers in {elapsed:.1f}s "
+          f"({len(answers) / elapsed:.1f} answers/sec)")
+
+def ann_recall_report(dataset, top_k=5, configs=None):
+    """
+    Compare approximate index types against the flat index on the dataset's questions.
+
+    The approximate indexes are built in memory from the vectors stored in the flat index, so no
+    corpus re-embedding is needed. Recall is the fraction of the flat top-k that each index returns.
+
+    Args:
+        dataset (list): List of Q&A pairs (questions and answers).
+        top_k (int): Number of top passages to retrieve.
+        configs (list): (index_type, build kwargs, search knobs) tuples to compare.
+
+    Returns:
+        list: One dict per configuration with recall, latency and index size.
+    """
+    if configs is None:
+        configs = [
+            ("ivf", {}, {"nprobe": 1}),
+            ("ivf", {}, {"nprobe": 8}),
+            ("ivf", {}, {"nprobe": 32}),
+            ("hnsw", {}, {"ef_search": 16}),
+            ("hnsw", {}, {"ef_search": 64}),
+            ("ivfpq", {}, {"nprobe": 8}),
+            ("ivfpq", {}, {"nprobe": 32}),
+        ]
+
+    flat_index = load_index()
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    query_embeddings = encode_queries([qa["question"] for qa in dataset])
+
+    def timed_search(index):
+        start = time.perf_counter()
+        _, indices = index.search(query_embeddings, top_k)
+        return indices, (time.perf_counter() - start) * 1000 / len(query_embeddings)
+
+    flat_indices, flat_ms = timed_search(flat_index)
+    report = [{
+        "index": "flat", "knobs": {}, "recall": 1.0, "ms_per_query": flat_ms,
+        "size_mb": faiss.serialize_index(flat_index).nbytes / 2**20
+    }]
+
+    built = {}
+    for index_type, build_kwargs, knobs in configs:
+        build_key = (index_type, tuple(sorted(build_kwargs.items())))
+        if build_key not in built:
+            built[build_key] = build_faiss_index(vectors, index_type=index_type, **build_kwargs)
+        index = configure_index(built[build_key], **knobs)
+
+        indices, ms = timed_search(index)
+        overlaps = [
+            len(set(ann_row[ann_row >= 0]) & set(flat_row)) / top_k
+            for ann_row, flat_row in zip(indices, flat_indices)
+        ]
+        report.append({
+            "index": index_type, "knobs": knobs, "recall": sum(overlaps) / len(overlaps), "ms_per_query": ms,
+            "size_mb": faiss.serialize_index(index).nbytes / 2**20
+        })
+
+    print(f"{'Index':<8} {'Knobs':<20} {'Recall@' + str(top_k):<10} {'ms/query':<10} {'Size (MB)':<10}")
+    for row in report:
+        knobs = ", ".join(f"{key}={value}" for key, value in row["knobs"].items())
+        print(f"{row['index']:<8} {knobs:<20} {row['recall']:<10.4f} {row['ms_per_query']:<10.3f} {row['size_mb']:<10.2f}")
+
+    return report
+
+def rerank_report(dataset, top_k=5, candidate_pool=50):
+    """
+    Compare retrieval with and without cross-encoder re-ranking: Recall@k, MRR and per-query latency.
+
+    Queries are retrieved one at a time, as the app does, so the latencies include the reranker's
+    forward pass. The reranker's score cache is cleared first so cached scores do not hide its cost.
+
+    Args:
+        dataset (list): List of Q&A pairs (questions and answers).
+        top_k (int): Number of top passages to retrieve.
+        candidate_pool (int): First-stage candidates passed to the reranker.
+
+    Returns:
+        dict: Metrics and latency percentiles (ms) per mode.
+    """
+    get_reranker().cache.clear()
+    report = {}
+    for mode, rerank in (("hybrid", False), (f"hybrid+rerank@{candidate_pool}", True)):
+        latencies = []
+
+        def timed_retriever(queries, top_k=top_k):
+            results = []
+            for query in queries:
+                start = time.perf_counter()
+                results.append(retrieve_passages_with_keywords(
+                    query, top_k=top_k, rerank=rerank, candidate_pool=candidate_pool
+                ))
+                latencies.append((time.perf_counter() - start) * 1000)
+            return results
+
+        metrics = compute_metrics(dataset, timed_retriever, top_k=top_k)
+        latencies.sort()
+        metrics["p50_ms"] = latencies[len(latencies) // 2]
+        metrics["p95_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        report[mode] = metrics
+
+    print(f"{'Mode':<22} {'Recall@' + str(top_k):<10} {'MRR':<8} {'p50 ms':<10} {'p95 ms':<10}")
+    for mode, metrics in report.items():
+        print(f"{mode:<22} {metrics['Recall@k']:<10.4f} {metrics['MRR']:<8.4f} {metrics['p50_ms']:<10.1f} {metrics['p95_ms']:<10.1f}")
+    return report
+
+def quantization_report(dataset, top_k=5, rescore_k=100, store_dir="data/quantized_400w40o"):
+    """
+    Compare two-phase search over int8, float16 and binary codes against the flat float32 index.
+
+    The codes are built from the vectors stored in the flat index (into `store_dir`, if it does
+    not hold a store yet). Recall is the fraction of the flat top-k each code type returns after
+    rescoring; Recall@k and MRR are the answer-level metrics of `compute_metrics`.
+
+    Args:
+        dataset (list): List of Q&A pairs (questions and answers).
+        top_k (int): Number of top passages to retrieve.
+        rescore_k (int): Candidates per query rescored in full precision.
+        store_dir (str): Directory of the quantized store.
+
+    Returns:
+        list: One dict per code type with memory, recall, metrics and latency.
+    """
+    flat_index = load_index()
+    if not os.path.exists(os.path.join(store_dir, "meta.json")):
+        build_quantized_store(flat_index.reconstruct_n(0, flat_index.ntotal), store_dir)
+    chunks_with_metadata = load_chunks_with_metadata()
+    query_embeddings = encode_queries([qa["question"] for qa in dataset])
+
+    def evaluate(index, name, memory_bytes):
+        start = time.perf_counter()
+        distances, indices = index.search(query_embeddings, top_k)
+        ms = (time.perf_counter() - start) * 1000 / len(query_embeddings)
+
+        def precomputed(queries, top_k=top_k):
+            return [
+                [{"rank": rank + 1, "name": chunks_with_metadata[idx]["name"], "distance": float(distance)}
+                 for rank, (idx, distance) in enumerate(zip(row_indices, row_distances)) if idx >= 0]
+                for row_indices, row_distances in zip(indices, distances)
+            ]
+
+        metrics = compute_metrics(dataset, precomputed, top_k=top_k, batch_size=len(dataset))
+        return {"index": name, "memory_mb": memory_bytes / 2**20, "indices": indices, "ms_per_query": ms,
+                "Recall@k": metrics["Recall@k"], "MRR": metrics["MRR"]}
+
+    report = [evaluate(flat_index, "float32", flat_index.ntotal * flat_index.d * 4)]
+    for code_type in CODE_TYPES:
+        index = QuantizedIndex(store_dir, code_type=code_type, rescore_k=rescore_k)
+        report.append(evaluate(index, code_type, index.memory_bytes()["codes"]))
+
+    flat_indices = report[0]["indices"]
+    for row in report:
+        overlaps = [
+            len(set(row_indices[row_indices >= 0]) & set(flat_row)) / top_k
+            for row_indices, flat_row in zip(row.pop("indices"), flat_indices)
+        ]
+        row["recall_vs_flat"] = sum(overlaps) / len(overlaps)
+
+    base = report[0]
+    print(f"{'Codes':<9} {'Memory (MB)':<12} {'Reduction':<10} {'Overlap':<9} {'Recall@' + str(top_k):<10} "
+          f"{'Delta':<9} {'MRR':<8} {'ms/query':<9}")
+    for row in report:
+        print(f"{row['index']:<9} {row['memory_mb']:<12.2f} {base['memory_mb'] / row['memory_mb']:<10.1f} "
+              f"{row['recall_vs_flat']:<9.4f} {row['Recall@k']:<10.4f} {row['Recall@k'] - base['Recall@k']:<+9.4f} "
+              f"{row['MRR']:<8.4f} {row['ms_per_query']:<9.3f}")
+    return report
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate retrieval and answer generation.")
+    parser.add_argument("--ann-report", action="store_true",
+                        help="Only compare approximate index types against the flat index.")
+    parser.add_argument("--rerank-report", action="store_true",
+                        help="Only compare retrieval with and without cross-encoder re-ranking.")
+    parser.add_argument("--quantization-report", action="store_true",
+                        help="Only compare int8/float16/binary codes with rescoring against the flat index.")
+    parser.add_argument("--retrieval-only", action="store_true",
+                        help="Only compute retrieval metrics; never load the generators.")
+    parser.add_argument("--retrieval-service", default=None,
+                        help="Retrieve through a running service.py, e.g. http://127.0.0.1:8010.")
+    parser.add_argument("--gpt-base-url", default=None,
+                        help="OpenAI-compatible base URL, e.g. the local stub at http://127.0.0.1:8008/v1.")
+    parser.add_argument("--gpt-concurrency", type=int, default=8,
+                        help="Maximum GPT requests in flight.")
+    parser.add_argument("--gpt-rps", type=float, default=5.0,
+                        help="Maximum GPT requests per second.")
+    args = parser.parse_args()
+
     with open("eval/line_loc.json", "r", encoding="utf-8") as file:
         dataset = json.load(file)
-    
-    metrics = compute_metrics(dataset, retrieve_passages_eval, top_k=5)
 
+    if args.ann_report:
+        ann_recall_report(dataset, top_k=5)
+        raise SystemExit
+
+    if args.rerank_report:
+        rerank_report(dataset, top_k=5)
+        raise SystemExit
+
+    if args.quantization_report:
+        quantization_report(dataset, top_k=5)
+        raise SystemExit
+
+    if args.retrieval_service:
+        retrieval_client = RetrievalClient(args.retrieval_service)
+    else:
+        # The dense-only baseline searches the local index directly
+        metrics = compute_metrics(dataset, retrieve_passages_eval, top_k=5)
+
+        print(f"Recall@5: {metrics['Recall@k']:.4f}")
+        print(f"MRR: {metrics['MRR']:.4f}")
+        print("-" * 80)
+
+    start = time.perf_counter()
+    metrics = compute_metrics(dataset, retriever, top_k=5)
+    elapsed = time.perf_counter() - start
+
+    print("Keyword retrieval (batched):")
     print(f"Recall@5: {metrics['Recall@k']:.4f}")
     print(f"MRR: {metrics['MRR']:.4f}")
+    print(f"Throughput: {len(dataset) / elapsed:.1f} queries/sec")
     print("-" * 80)
 
+    if args.retrieval_only:
+        print(f"Resource load times: {registry.report()}")
+        raise SystemExit
+
     print("Evaluating LLaMA...")
     evaluate_and_print(
-        model=generator_pipeline,
+        model=get_generator_pipeline(),
         dataset_path="eval/understanding.json",
         top_k=5
     )
     print("-" * 80)
     
     print("Evaluating GPT...")
-    def gpt_model(input_text):
-        query = input_text.split("Question:")[1].split("\n")[0].strip()
-        retrieved_passages = retriever(query, top_k=5)
-        return [{"generated_text": generate_answer_with_gpt(query, retrieved_passages)}]
-
-    evaluate_and_print(
-        model=gpt_model,
+    evaluate_gpt_concurrently(
         dataset_path="eval/understanding.json",
-        top_k=5
-    )
\ No newline at end of file
+        top_k=5,
+        base_url=args.gpt_base_url,
+        max_concurrency=args.gpt_concurrency,
+        requests_per_second=args.gpt_rps
+    )
@@ -1,25 +1,169 @@
-import json
-import faiss
-from sentence_transformers import SentenceTransformer
+import time
 from utils.retrieve import *
-from utils.openai import generate_answer_with_gpt
+from utils.openai import generate_answer_with_gpt, stream_answer_with_gpt, MODEL_VERSION
+from utils import llama
+from utils import llama_server
+from utils.cache import TTLCache, answer_cache_key
+from utils.line_locator import describe_line_match, asks_for_source
+from utils.indexing import load_index_manifest, verify_index_manifest
+from utils.retrieval_client import RetrievalClient
+from utils import metrics
+
+# Answers for recently seen (query, passages) pairs, shared by every caller in this process
+answer_cache = TTLCache(max_size=512, ttl=3600)
+
+# Set by use_retrieval_service: retrieval then runs in service.py instead of in this process
+retrieval_client = None
+
+def use_retrieval_service(base_url):
+    """
+    Send retrieval to a running `service.py` instead of loading the index and models here.
+
+    Args:
+        base_url (str): Address of the service, e.g. "http://127.0.0.1:8010".
+
+    Returns:
+        RetrievalClient: The client now used by `process_query` and `stream_query`.
+    """
+    global retrieval_client
+    retrieval_client = RetrievalClient(base_url)
+    return retrieval_client
+
+def retrieve(query, top_k=5, min_score=None):
+    if retrieval_client is not None:
+        return retrieval_client.retrieve(query, top_k=top_k, min_score=min_score)
+    return retrieve_passages_with_keywords(query, top_k, min_score=min_score)
 
 # Load resources
-def load_resources():
-    index = faiss.read_index("data/faiss_index_400w40o.bin")
+# min_score: the similarity cutoff the caller will pass to process_query/stream_query, checked
+# against the index here so a misconfigured cutoff fails at startup rather than on the first query
+# quantized_store: directory written by process.py (quantized_store_dir); dense search then scans its
+# compact codes (quantized_code) and rescores rescore_k candidates, and the float32 index is never loaded
+def load_resources(nprobe=None, ef_search=None, warm_up=True, service_url=None, min_score=None,
+                   quantized_store=None, quantized_code="int8", rescore_k=100):
+    # With a retrieval service nothing is loaded here; the service holds the index and models
+    if service_url:
+        use_retrieval_service(service_url)
+        return None, None, None
 
-    with open("data/all_chunks_400w40o_with_metadata.json", "r", encoding="utf-8") as file:
-        metadata = json.load(file)
+    if quantized_store:
+        if not registry.is_loaded("filtered_index"):
+            use_quantized_index(quantized_store, code_type=quantized_code, rescore_k=rescore_k)
+        index = load_filtered_index().index
+    else:
+        # nprobe / ef_search trade recall for speed on IVF / HNSW indexes; ignored for flat indexes
+        index = load_index("data/faiss_index_400w40o.bin", nprobe=nprobe, ef_search=ef_search)
 
-    embedder = SentenceTransformer('all-MiniLM-L6-v2')
+    # All shared with utils.retrieve through the resource registry: each is loaded once per process
+    metadata = load_chunks_with_metadata()
+    embedder = get_embedder()
+
+    # Fail fast if the index was built by another model or with another metric than it is queried with
+    manifest = load_index_manifest("data/faiss_index_400w40o.bin")
+    if manifest is None:
+        if min_score is not None:
+            raise ValueError("min_score needs an index built from normalized vectors; rebuild it with process.py.")
+        print("No manifest for data/faiss_index_400w40o.bin; scores may be raw dot products. Rebuild it with process.py.")
+    else:
+        verify_index_manifest(
+            manifest, index, EMBEDDING_MODEL, embedder.get_sentence_embedding_dimension(),
+            require_normalized=min_score is not None
+        )
+
+    # Build the lexical/keyword structures off the request path
+    if warm_up:
+        registry.warm_up(RETRIEVAL_RESOURCES, background=True)
     return index, metadata, embedder
 
+def answered_by_lookup(query, results):
+    """
+    Whether the line lookup alone answers the query: it asks which work contains a quoted line and
+    the line was found verbatim. Every other query, including fuzzy matches and questions about a
+    quoted line's meaning, goes to the generator with the located passages as context.
+    """
+    return (bool(results) and results[0].get("source") == "line_locator"
+            and results[0]["distance"] == 1.0 and asks_for_source(query))
+
 # Process a query
-def process_query(query, index, metadata, embedder, top_k=5):
-    results = retrieve_passages_with_keywords(query, top_k)
-    answer = generate_answer_with_gpt(query, results)
+# backend="llama" sends the question to the local batched Llama server instead of OpenAI
+# min_score drops passages less similar than the cutoff before they reach the generator
+def process_query(query, index, metadata, embedder, top_k=5, use_cache=True, backend="openai", min_score=None):
+    results = retrieve(query, top_k, min_score=min_score)
+
+    # "Which work contains this line" and the line was found verbatim: the answer is the lookup itself
+    if answered_by_lookup(query, results):
+        return results, describe_line_match(results[0])
+
+    if backend == "openai":
+        model_version, generate = MODEL_VERSION, generate_answer_with_gpt
+    elif backend == "llama":
+        model_version, generate = llama_server.MODEL_VERSION, llama_server.get_llama_server().generate
+    else:
+        raise ValueError(f"Unknown backend '{backend}'.")
+
+    if not use_cache:
+        return results, generate(query, results)
+
+    # Same query, same passages and same prompt: reuse the answer instead of calling the generator
+    key = answer_cache_key(query, top_k, results, model_version)
+    answer = answer_cache.get(key)
+    metrics.increment("answer_cache_hits_total" if answer is not None else "answer_cache_misses_total")
+    if answer is None:
+        answer = generate(query, results)
+        answer_cache.put(key, answer)
     return results, answer
 
+# Stream the answer to a query
+def stream_query(query, index, metadata, embedder, top_k=5, use_cache=True, backend="openai", min_score=None):
+    """
+    Retrieve passages, then stream the answer as it is generated.
+
+    Retrieval finishes before this returns, so callers can show the passages right away and
+    render the answer piece by piece while the generator is still running.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of passages to retrieve.
+        use_cache (bool): Serve and store complete GPT answers in the answer cache.
+        backend (str): "openai" or "llama".
+        min_score (float): Optional cosine similarity cutoff; weaker passages are never sent to the generator.
+
+    Returns:
+        tuple: (results, answer_stream), where answer_stream yields pieces of the answer text.
+    """
+    results = retrieve(query, top_k, min_score=min_score)
+
+    if answered_by_lookup(query, results):
+        return results, iter([describe_line_match(results[0])])
+
+    if backend == "llama":
+        # Sampled, so not cached
+        return results, llama.stream_answer(query, results)
+    if backend != "openai":
+        raise ValueError(f"Unknown backend '{backend}'.")
+
+    key = answer_cache_key(query, top_k, results, MODEL_VERSION) if use_cache else None
+    if use_cache:
+        cached = answer_cache.get(key)
+        metrics.increment("answer_cache_hits_total" if cached is not None else "answer_cache_misses_total")
+        if cached is not None:
+            return results, iter([cached])
+
+    def answer_stream():
+        pieces = []
+        start = time.perf_counter()
+        with metrics.span("generate_answer_with_gpt"):
+            for piece in stream_answer_with_gpt(query, results):
+                if not pieces:
+                    metrics.observe("first_token", (time.perf_counter() - start) * 1000)
+                pieces.append(piece)
+                yield piece
+        # Only complete answers are cached; an abandoned stream never gets here
+        if use_cache:
+            answer_cache.put(key, "".join(pieces))
+
+    return results, answer_stream()
+
 if __name__ == "__main__":
     # Load resources
     index, metadata, embedder = load_resources()
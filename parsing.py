@@ -91,6 +91,147 @@ def parse_sonnets(sonnets_text):
     return sonnets
 
 
+_SONNET_NUMBER = re.compile(r"\s*\d+")
+_GUTENBERG_END = re.compile(r"^\*\*\* ?END OF (?:THE|THIS) PROJECT GUTENBERG", re.IGNORECASE)
+
+
+def read_contents(lines):
+    """
+    Consume lines up to the end of the 'Contents' section and return the titles listed in it.
+
+    The section ends at the first two consecutive blank lines after a title, as in `parse_contents`.
+
+    Args:
+        lines (iterator): Line iterator, e.g. an open file; left positioned after the section.
+
+    Returns:
+        list: Titles in contents order.
+    """
+    for line in lines:
+        if line.strip().lower() == "contents":
+            break
+    else:
+        raise ValueError("Contents section not found in the text.")
+
+    titles = []
+    blank_lines = 0
+    for line in lines:
+        line = line.strip()
+        if line:
+            titles.append(line)
+            blank_lines = 0
+        elif titles:
+            blank_lines += 1
+            if blank_lines == 2:
+                break
+    return titles
+
+
+class _SonnetSplitter:
+    """
+    Incremental version of the `parse_sonnets` split: a line holding only a number, followed by an
+    empty line, starts a sonnet; text before the first number (the heading) is dropped.
+    """
+
+    def __init__(self):
+        self.number = None
+        self.buffer = []
+        self.pending = None
+
+    def feed(self, line):
+        """
+        Returns:
+            list: (number, contents) of the sonnets completed by this line.
+        """
+        completed = []
+        if self.pending is not None:
+            if line == "":
+                if self.number is not None:
+                    completed.append((self.number, "\n".join(self.buffer).strip()))
+                self.number, self.buffer, self.pending = self.pending.strip(), [], None
+                return completed
+            self.buffer.append(self.pending)
+            self.pending = None
+        if _SONNET_NUMBER.fullmatch(line):
+            self.pending = line
+        else:
+            self.buffer.append(line)
+        return completed
+
+    def close(self):
+        if self.pending is not None:
+            self.buffer.append(self.pending)
+        if self.number is None:
+            return []
+        return [(self.number, "\n".join(self.buffer).strip())]
+
+
+def iter_books(file, titles=None):
+    """
+    Stream books out of a Gutenberg collection file in a single pass.
+
+    Books are recognized by their titles, in contents order, so each line is looked at once and
+    only the book being read is held in memory. "THE SONNETS" is split into one record per sonnet
+    as it is read. Reading stops at the Project Gutenberg end-of-text marker.
+
+    Args:
+        file (iterable): Open text file (or any iterable of lines) positioned at its start.
+        titles (list): Book titles in order; read from the file's 'Contents' section when omitted.
+
+    Yields:
+        dict: {"id", "name", "contents"}, with the IDs produced by `extract_books_from_index`.
+    """
+    lines = (line.rstrip("\r\n") for line in file)
+    if titles is None:
+        titles = read_contents(lines)
+    if not titles:
+        return
+
+    def book_record(position, lines_of_book):
+        return {"id": f"book_{position}", "name": titles[position], "contents": "\n".join(lines_of_book).strip()}
+
+    def sonnet_records(completed):
+        for number, contents in completed:
+            yield {"id": f"sonnet_{number}", "name": f"Sonnet {number}", "contents": contents}
+
+    position = -1
+    buffer = []
+    sonnets = None
+    for line in lines:
+        if _GUTENBERG_END.match(line):
+            break
+        next_title = titles[position + 1] if position + 1 < len(titles) else None
+        start = line.find(next_title) if next_title else -1
+        if start == -1:
+            if sonnets is not None:
+                yield from sonnet_records(sonnets.feed(line))
+            elif position >= 0:
+                buffer.append(line)
+            continue
+
+        # The title line closes the previous book and opens the next one
+        if sonnets is not None:
+            yield from sonnet_records(sonnets.feed(line[:start]))
+            yield from sonnet_records(sonnets.close())
+        elif position >= 0:
+            buffer.append(line[:start])
+            yield book_record(position, buffer)
+        position += 1
+        buffer = [line[start:]]
+        sonnets = None
+        if titles[position].lower() == "the sonnets":
+            sonnets = _SonnetSplitter()
+            sonnets.feed(line[start:])
+            buffer = []
+
+    if sonnets is not None:
+        yield from sonnet_records(sonnets.close())
+    elif position >= 0:
+        yield book_record(position, buffer)
+    if position + 1 < len(titles):
+        raise ValueError(f"Book title '{titles[position + 1]}' not found in the text.")
+
+
 def save_to_json(data, output_path):
     """
     Save the parsed contents to a JSON file.
@@ -99,17 +240,25 @@ def save_to_json(data, output_path):
         json.dump(data, file, ensure_ascii=False, indent=4)
 
 
+def save_records_to_json(records, output_path):
+    """
+    Write records to a JSON array one at a time, so a stream of books is never held in memory.
+    """
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write("[")
+        for idx, record in enumerate(records):
+            file.write(",\n" if idx else "\n")
+            file.write(json.dumps(record, ensure_ascii=False, indent=4))
+        file.write("\n]")
+
+
 if __name__ == "__main__":
     with open("./data/pg100.txt", "r", encoding="utf-8") as file:
-        text = file.read()
-        contents, index_dict, book_content = parse_contents(text)
+        # One pass over the file: the contents section first, then the books it lists
+        titles = read_contents(file)
+        contents = [{"id": f"book_{idx + 1}", "name": title} for idx, title in enumerate(titles)]
         save_to_json(contents, "parsed_contents.json")
         print(f"Parsed contents saved to parsed_contents.json")
 
-        books = extract_books_from_index(book_content, index_dict)
-
-        save_to_json(book_content, "books.json")
-        print(f"Books saved to books.json")
-        save_to_json(books, "books_with_sonnets.json")
+        save_records_to_json(iter_books(file, titles), "books_with_sonnets.json")
         print(f"Books with sonnets saved to books_with_sonnets.json.")
-
@@ -1,7 +1,9 @@
 from utils.chunking import *
 from utils.data_processing import *
+from parsing import read_contents, iter_books
 from utils.retrieve import *
 from utils.openai import *
+from utils.indexing import embed_chunks, build_faiss_index, write_index_manifest
 from sentence_transformers import SentenceTransformer
 import json
 import numpy as np
@@ -11,44 +13,15 @@ import faiss
 # Parse the contents of a text file, extract book titles and their contents, and save the results to JSON files.
 ###
 with open("pg100.txt", "r", encoding="utf-8") as file:
-    text = file.read()
-    contents, index_dict, book_content = parse_contents(text)
+    # One pass over the file: the contents section first, then the books it lists
+    titles = read_contents(file)
+    contents = [{"id": f"book_{idx + 1}", "name": title} for idx, title in enumerate(titles)]
     save_to_json(contents, "parsed_contents.json")
     print(f"Parsed contents saved to parsed_contents.json")
 
-    # Extract books and their contents
-    books = extract_books_from_index(book_content, index_dict)
-    # Save the parsed contents to a JSON file
-    save_to_json(book_content, "books.json")
-    print(f"Books saved to books.json")
-    save_to_json(books, "books_with_sonnets.json")
-    print(f"Books with sonnets saved to books_with_sonnets.json.")
-
-# Chunk the text into smaller pieces for processing
-with open("books_with_sonnets.json", "r", encoding="utf-8") as file:
-    books = json.load(file)
-
-chunks = []
-
-for book in books:
-    if "sonnet" in book["id"]:
-        # Treat each sonnet as a single chunk
-        chunks.append({
-            "id": book["id"],
-            "name": book["name"],
-            "contents": book["contents"]
-        })
-    else:
-        # Chunk longer books (plays) by token size
-        # book_chunks = chunk_text(book["contents"], max_tokens=300, overlap=50)
-        book_chunks = chunk_text_by_words(book["contents"])
-
-        for idx, chunk in enumerate(book_chunks):
-            chunks.append({            
-                "id": f"{book['id']}_chunk_{idx + 1}",
-                "name": f"{book['name']} (Chunk {idx + 1})",
-                "contents": chunk
-            })
+    # Chunk the books as they are parsed (sonnets stay whole); `python parsing.py` writes
+    # books_with_sonnets.json for the line locator
+    chunks = list(chunk_books(iter_books(file, titles)))
 
 # Save the combined chunks to a new JSON file
 with open("all_chunks_300w.json", "w", encoding="utf-8") as output_file:
@@ -64,27 +37,19 @@ embedder = SentenceTransformer('all-MiniLM-L6-v2')
 with open("all_chunks_300w.json", "r", encoding="utf-8") as file:
     chunks = json.load(file)
 
-# Generate embeddings for each chunk
-embeddings = []
-
-for chunk in chunks:
-    embedding = embedder.encode(chunk["contents"], convert_to_numpy=True)
-    embeddings.append(embedding)
-
-# Convert to a NumPy array
-embeddings = np.array(embeddings)
+# Generate embeddings for each chunk, reusing cached vectors for unchanged chunks
+embeddings = embed_chunks(chunks, embedder, store_dir="embedding_store", batch_size=64, compact=True)
 print(f"Generated embeddings for {len(embeddings)} chunks.")
 
 # FAISS
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatIP(dimension) # Inner product index
-index.add(embeddings)
+index = build_faiss_index(embeddings, index_type="flat", normalize=True) # "ivf", "hnsw" or "ivfpq" for approximate search
 
 print(f"FAISS index contains {index.ntotal} embeddings.")
 
 # Save the FAISS index to a file
 faiss_outpath = "faiss_index.bin"
 faiss.write_index(index, faiss_outpath)
+write_index_manifest(index, faiss_outpath, "all-MiniLM-L6-v2", normalized=True)
 print(f"FAISS index saved to {faiss_outpath}.")
 
 # Adding metadata to the index
@@ -115,41 +80,26 @@ print(f"Updated chunks saved to all_chunks_300w_with_metadata.json")
 
 ### from copilot
 import json
-import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
-from utils.chunking import chunk_text_by_words
-
-def process_text_file(input_file, output_chunks_file, output_metadata_file, faiss_index_file):
-    # Step 1: Read the text file
+from utils.chunking import chunk_books, chunk_books_by_structure
+from parsing import iter_books
+from utils.indexing import embed_chunks, build_faiss_index, normalize_embeddings, write_index_manifest
+from utils.chunk_store import build_chunk_store
+from utils.line_index import build_line_index
+from utils.quantized_store import build_quantized_store
+
+def process_text_file(input_file, output_chunks_file, output_metadata_file, faiss_index_file, embedding_store_dir=None,
+                      batch_size=64, num_workers=0, index_type="flat", chunk_store_dir=None, chunking="words",
+                      max_words=400, line_index_dir=None, quantized_store_dir=None, normalize=True,
+                      compact_embedding_store=True):
+    # Steps 1-4: Stream the books out of the text file and chunk them as they are read.
+    # "structure" chunks plays by scene and speech (no overlap) and carries act/scene/speaker metadata.
     with open(input_file, "r", encoding="utf-8") as file:
-        text = file.read()
-
-    # Step 2: Parse the contents (assuming `parse_contents` is defined elsewhere)
-    contents, index_dict, book_content = parse_contents(text)
-
-    # Step 3: Extract books and their contents
-    books = extract_books_from_index(book_content, index_dict)
-
-    # Step 4: Chunk the text
-    chunks = []
-    for book in books:
-        if "sonnet" in book["id"]:
-            # Treat each sonnet as a single chunk
-            chunks.append({
-                "id": book["id"],
-                "name": book["name"],
-                "contents": book["contents"]
-            })
+        if chunking == "structure":
+            chunks = list(chunk_books_by_structure(iter_books(file), max_words=max_words))
         else:
-            # Chunk longer books (plays) by word size
-            book_chunks = chunk_text_by_words(book["contents"])
-            for idx, chunk in enumerate(book_chunks):
-                chunks.append({
-                    "id": f"{book['id']}_chunk_{idx + 1}",
-                    "name": f"{book['name']} (Chunk {idx + 1})",
-                    "contents": chunk
-                })
+            chunks = list(chunk_books(iter_books(file), max_words=max_words))
 
     # Step 5: Save chunks to a JSON file
     with open(output_chunks_file, "w", encoding="utf-8") as output_file:
@@ -157,21 +107,35 @@ def process_text_file(input_file, output_chunks_file, output_metadata_file, fais
 
     print(f"Chunks saved to {output_chunks_file}")
 
-    # Step 6: Generate embeddings
+    # Step 6: Generate embeddings, only for chunks missing from the embedding store. Vectors of
+    # chunks that no longer exist are then dropped, unless the store is shared with another chunking.
     embedder = SentenceTransformer('all-MiniLM-L6-v2')
-    embeddings = [embedder.encode(chunk["contents"], convert_to_numpy=True) for chunk in chunks]
-    embeddings = np.array(embeddings)
+    embeddings = embed_chunks(
+        chunks, embedder, store_dir=embedding_store_dir, batch_size=batch_size, num_workers=num_workers,
+        compact=compact_embedding_store
+    )
 
-    # Step 7: Create and save FAISS index
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings)
+    # Step 7: Create and save FAISS index. Normalized vectors make the inner product a cosine
+    # similarity, so scores do not favour long chunks and can be thresholded.
+    if normalize:
+        embeddings = normalize_embeddings(embeddings)
+    index = build_faiss_index(embeddings, index_type=index_type)
     faiss.write_index(index, faiss_index_file)
+    write_index_manifest(index, faiss_index_file, "all-MiniLM-L6-v2", normalized=normalize)
     print(f"FAISS index saved to {faiss_index_file}")
 
+    # Step 7b: Write int8/float16/binary codes for two-phase (compact scan, exact rescore) search
+    if quantized_store_dir:
+        build_quantized_store(embeddings, quantized_store_dir)
+        print(f"Quantized store saved to {quantized_store_dir}")
+
     # Step 8: Add metadata to chunks
     updated_chunks = []
     for chunk in chunks:
+        if "metadata" in chunk:
+            # Structure-aware chunks already carry their metadata
+            updated_chunks.append(chunk)
+            continue
         genre = "Play" if "sonnet" not in chunk["id"] else "Sonnet"
         title = chunk["name"].split(" (")[0] if genre == "Play" else chunk["name"]
         metadata = {
@@ -190,11 +154,28 @@ def process_text_file(input_file, output_chunks_file, output_metadata_file, fais
 
     print(f"Metadata saved to {output_metadata_file}")
 
+    # Step 10: Write the compact chunk store loaded by the app
+    if chunk_store_dir:
+        build_chunk_store(updated_chunks, chunk_store_dir)
+        print(f"Chunk store saved to {chunk_store_dir}")
+
+    # Step 11: Embed the lines of every chunk for two-level (chunk, then line) retrieval
+    if line_index_dir:
+        with open(input_file, "r", encoding="utf-8") as file:
+            build_line_index(
+                iter_books(file), updated_chunks, embedder, line_index_dir, max_words=max_words,
+                batch_size=batch_size, num_workers=num_workers
+            )
+
 # Run the data processing pipeline
 if __name__ == "__main__":
     process_text_file(
         input_file="pg100.txt",
         output_chunks_file="all_chunks_300w.json",
         output_metadata_file="all_chunks_300w_with_metadata.json",
-        faiss_index_file="faiss_index.bin"
+        faiss_index_file="faiss_index.bin",
+        embedding_store_dir="embedding_store",
+        chunk_store_dir="chunk_store_300w",
+        line_index_dir="line_index_300w",
+        quantized_store_dir="quantized_300w"
     )
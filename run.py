@@ -1,5 +1,7 @@
+import os
 import streamlit as st
-from main import load_resources, process_query
+from main import load_resources, stream_query
+from utils import metrics
 
 st.set_page_config(
     page_title="Shakespeare RAG System",
@@ -10,26 +12,59 @@ st.set_page_config(
 st.title("Shakespeare RAG System")
 st.write("Enter a query to retrieve relevant passages and generate an answer.")
 
+# Optional cosine similarity cutoff (e.g. MIN_SCORE=0.3): weaker passages are not shown or sent to the LLM
+MIN_SCORE = float(os.environ["MIN_SCORE"]) if os.environ.get("MIN_SCORE") else None
+
 @st.cache_resource
 def load_cached_resources():
-    return load_resources()
+    # Resources live in the process-wide registry; this only avoids repeating the warm-up per rerun.
+    # With RETRIEVAL_SERVICE_URL set (e.g. http://127.0.0.1:8010), retrieval goes to service.py and
+    # no index or embedder is loaded in this process. QUANTIZED_STORE (e.g. data/quantized_400w40o)
+    # searches int8 codes with exact rescoring instead of loading the float32 index.
+    return load_resources(
+        warm_up=True, service_url=os.environ.get("RETRIEVAL_SERVICE_URL"), min_score=MIN_SCORE,
+        quantized_store=os.environ.get("QUANTIZED_STORE")
+    )
 
 index, metadata, embedder = load_cached_resources()
 
+@st.cache_resource
+def start_metrics():
+    # Instrumentation is process-wide, so it is switched on once per server process rather than by
+    # each session: METRICS=1, plus METRICS_JSONL for a trace file and/or METRICS_PORT for Prometheus.
+    # While off, it costs one flag check per instrumented call.
+    return metrics.enable_from_env()
+
+show_timings = start_metrics() and st.sidebar.checkbox("Show per-query timings", value=False)
+
 # Input query
 query = st.text_input("Enter your query:", placeholder="e.g., Which sonnet has the line 'Shall I compare thee to a summer's day'?")
 
 if query:
-    st.write("Processing your query...")
-    results, answer = process_query(query, index, metadata, embedder)
-
-    # Display results
-    st.subheader("Generated Answer:")
-    st.write(answer)
-    
-    st.subheader("Top Retrieved Passages:")
-    for idx, result in enumerate(results):
-        st.write(f"**Passage #{idx + 1}:**")
-        st.write(f"**Title:** {result['name']}")
-        st.write(f"**Contents:** {result['contents']}")
-        st.write("---")
+    with metrics.request() as trace:
+        # Passages render as soon as the search returns; the answer streams in above them
+        results, answer_stream = stream_query(query, index, metadata, embedder, min_score=MIN_SCORE)
+
+        st.subheader("Generated Answer:")
+        answer_placeholder = st.empty()
+        answer_placeholder.write("Generating answer...")
+
+        st.subheader("Top Retrieved Passages:")
+        for idx, result in enumerate(results):
+            st.write(f"**Passage #{idx + 1}:**")
+            st.write(f"**Title:** {result['name']}")
+            st.write(f"**Contents:** {result['contents']}")
+            st.write("---")
+
+        # Streamlit 1.25 has no st.write_stream: redraw one placeholder as pieces arrive
+        answer = ""
+        for piece in answer_stream:
+            answer += piece
+            answer_placeholder.markdown(answer + "▌")
+        answer_placeholder.markdown(answer)
+
+    if show_timings and trace is not None:
+        with st.expander(f"Timings (request {trace.request_id})", expanded=True):
+            for span in trace.spans:
+                st.text(f"{'  ' * span['depth']}{span['name']}: {span['ms']:.1f} ms")
+            st.json(metrics.snapshot()["counters"])
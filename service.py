@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from utils.retrieve import load_index, retrieve_batch, use_quantized_index, RETRIEVAL_RESOURCES
+from utils.resources import registry
+
+# Keyword arguments of `retrieve_batch` that clients may set
+RETRIEVAL_OPTIONS = {"hybrid", "candidate_k", "rrf_k", "rerank", "candidate_pool", "min_score", "top_n_chunks"}
+
+
+class RetrievalBatcher:
+    """
+    Request queue that merges concurrent queries into one `retrieve_batch` call.
+
+    Handler threads submit single queries; one worker thread drains the queue into batches of up
+    to `max_batch_size`, waiting at most `max_wait` seconds for a batch to fill, so concurrent
+    clients share one query encode and one index search per filter group.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait=0.005):
+        """
+        Args:
+            max_batch_size (int): Maximum queries retrieved together.
+            max_wait (float): Seconds to wait for more queries after the first one arrives.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, query, top_k=5, **options):
+        """
+        Queue a query for retrieval.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the query's retrieved passages.
+        """
+        future = Future()
+        self._queue.put((query, top_k, tuple(sorted(options.items())), future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Only queries asking for the same top_k and options can share a call
+            groups = {}
+            for query, top_k, options, future in batch:
+                if future.set_running_or_notify_cancel():
+                    groups.setdefault((top_k, options), []).append((query, future))
+
+            for (top_k, options), members in groups.items():
+                queries, futures = zip(*members)
+                try:
+                    results = retrieve_batch(list(queries), top_k=top_k, **dict(options))
+                except Exception as error:
+                    for future in futures:
+                        future.set_exception(error)
+                    continue
+
+                self.batches += 1
+                self.requests += len(members)
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+
+
+def _json_default(value):
+    # Scores come back as NumPy scalars
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    """
+    POST /retrieve {"query", "top_k", ...options} -> {"results": [...]}
+    POST /retrieve_batch {"queries", "top_k", ...options} -> {"results": [[...], ...]}
+    GET /health -> worker PID and batching counters
+    """
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        batcher = self.server.batcher
+        self._send_json(200, {
+            "status": "ok", "pid": os.getpid(), "batches": batcher.batches, "requests": batcher.requests
+        })
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            top_k = int(body.pop("top_k", 5))
+            if self.path == "/retrieve":
+                query = body.pop("query")
+            elif self.path == "/retrieve_batch":
+                queries = body.pop("queries")
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            unknown = set(body) - RETRIEVAL_OPTIONS
+            if unknown:
+                raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(400, {"error": str(error)})
+            return
+
+        try:
+            if self.path == "/retrieve":
+                results = self.server.batcher.submit(query, top_k=top_k, **body).result()
+            else:
+                # Already a batch: no need to wait for other clients
+                results = retrieve_batch(queries, top_k=top_k, **body)
+        except Exception as error:
+            self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+        self._send_json(200, {"results": results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8010):
+    """
+    Bind the service socket without starting to serve, so forked workers can share it.
+
+    Returns:
+        ThreadingHTTPServer: The bound server.
+    """
+    server = ThreadingHTTPServer((host, port), RetrievalHandler)
+    server.daemon_threads = True
+    return server
+
+def _serve(server, max_batch_size, max_wait, threads_per_worker):
+    if threads_per_worker:
+        # Keep workers from oversubscribing the cores between them
+        import faiss
+        import torch
+        faiss.omp_set_num_threads(threads_per_worker)
+        torch.set_num_threads(threads_per_worker)
+    # Threads do not survive fork, so each worker starts its own batcher
+    server.batcher = RetrievalBatcher(max_batch_size=max_batch_size, max_wait=max_wait)
+    server.serve_forever()
+
+def serve(host="127.0.0.1", port=8010, workers=2, max_batch_size=32, max_wait=0.005, threads_per_worker=None,
+          quantized_store=None, quantized_code="int8", rescore_k=100):
+    """
+    Load the retrieval resources once, then fork workers that accept on the same socket.
+
+    The chunk store is a memory-mapped file, and the index is memory-mapped on FAISS builds with
+    IO_FLAG_MMAP_IFC, so the workers share their pages through the page cache. With the pinned
+    faiss-cpu 1.7.4 a flat or HNSW index is read into the parent's memory instead and, like the
+    embedder and the lexical structures loaded before forking, only shared copy-on-write.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        workers (int): Worker processes; 1 serves in this process.
+        max_batch_size (int): Maximum queries per micro-batch.
+        max_wait (float): Seconds a query waits for others to join its batch.
+        threads_per_worker (int): Optional FAISS/torch thread count per worker.
+        quantized_store (str): Optional directory of a quantized store to search instead of the
+            FAISS index. Its codes are shared copy-on-write and its float32 rows are memory-mapped.
+        quantized_code (str): Codes scanned in the quantized store: "int8", "float16" or "binary".
+        rescore_k (int): Candidates per query rescored in full precision from the quantized store.
+    """
+    if quantized_store:
+        use_quantized_index(quantized_store, code_type=quantized_code, rescore_k=rescore_k)
+    else:
+        load_index(mmap=True)
+    for name in RETRIEVAL_RESOURCES:
+        registry.get(name)
+    print(f"Resources loaded: {registry.report()}")
+
+    server = make_server(host, port)
+    print(f"Retrieval service listening on http://{host}:{port} with {workers} worker(s)")
+    if workers <= 1:
+        _serve(server, max_batch_size, max_wait, threads_per_worker)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                _serve(server, max_batch_size, max_wait, threads_per_worker)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        raise SystemExit
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve retrieve and retrieve_batch over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--quantized-store", default=None, help="Search this quantized store instead of the FAISS index.")
+    parser.add_argument("--quantized-code", default="int8", choices=["int8", "float16", "binary"])
+    parser.add_argument("--rescore-k", type=int, default=100)
+    args = parser.parse_args()
+
+    serve(
+        host=args.host, port=args.port, workers=args.workers, max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000, threads_per_worker=args.threads_per_worker,
+        quantized_store=args.quantized_store, quantized_code=args.quantized_code, rescore_k=args.rescore_k
+    )
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+import pytest
+
+pytest.importorskip("openai")
+
+from utils.async_generation import AsyncGenerationClient
+from utils.openai import build_messages
+from utils.openai_stub import make_server
+
+PASSAGES = [{"name": "Sonnet 18", "contents": "Shall I compare thee to a summer's day?"}]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server = make_server(port=0, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def generate(base_url, queries, **kwargs):
+    async def run():
+        client = AsyncGenerationClient(api_key="test", base_url=base_url, requests_per_second=1000, **kwargs)
+        try:
+            return await client.generate_many(queries, [PASSAGES] * len(queries)), client.retries
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_concurrency_limit_is_respected(stub):
+    server, base_url = stub(latency=0.1)
+    answers, _ = generate(base_url, [f"question {i}" for i in range(12)], max_concurrency=3)
+    assert all(isinstance(answer, str) for answer in answers)
+    assert server.max_in_flight == 3
+
+
+def test_results_come_back_in_input_order(stub):
+    _, base_url = stub(latency=0.01)
+    # The stub echoes the prompt length, which differs per query
+    queries = ["Who?" + " really" * i for i in range(10)]
+    answers, _ = generate(base_url, list(reversed(queries)), max_concurrency=4)
+    expected = [
+        f"Stub answer ({len(build_messages(query, PASSAGES)[-1]['content'])} prompt chars)."
+        for query in reversed(queries)
+    ]
+    assert answers == expected
+
+
+def test_rate_limited_requests_are_retried_after_retry_after(stub):
+    server, base_url = stub(latency=0.0, rate_limit_rate=1.0, retry_after=0.05)
+    start = time.monotonic()
+    answers, retries = generate(base_url, ["question"], max_retries=2)
+    assert isinstance(answers[0], Exception)
+    assert server.requests == 3
+    assert retries == 2
+    # Two waits of the Retry-After delay between the three attempts
+    assert time.monotonic() - start >= 0.1
+
+
+def test_server_errors_are_retried_with_backoff(stub):
+    server, base_url = stub(latency=0.0, error_rate=1.0)
+    answers, retries = generate(base_url, ["question"], max_retries=3, base_delay=0.01, max_delay=0.05)
+    assert isinstance(answers[0], Exception)
+    assert server.requests == 4
+    assert retries == 3
+
+
+def test_transient_failures_recover(stub):
+    server, base_url = stub(latency=0.0, rate_limit_rate=0.3, error_rate=0.2, retry_after=0.01)
+    answers, retries = generate(base_url, [f"question {i}" for i in range(20)], max_retries=30, base_delay=0.01,
+                                max_delay=0.02)
+    assert all(isinstance(answer, str) for answer in answers)
+    assert retries > 0
+    assert server.requests == 20 + retries
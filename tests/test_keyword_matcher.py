@@ -0,0 +1,32 @@
+from utils.keyword_matcher import KeywordMatcher, title_aliases
+
+TITLES = [
+    "THE COMEDY OF ERRORS",
+    "THE TRAGEDY OF HAMLET, PRINCE OF DENMARK",
+    "THE TRAGEDY OF KING LEAR",
+]
+
+
+def test_common_word_is_not_an_alias():
+    aliases = title_aliases("THE COMEDY OF ERRORS")
+    assert "comedy of errors" in aliases
+    assert "errors" not in aliases
+
+
+def test_common_word_does_not_filter_query():
+    matcher = KeywordMatcher(TITLES)
+    assert matcher.match("What errors does Hamlet make?")["names"] == ["THE TRAGEDY OF HAMLET, PRINCE OF DENMARK"]
+    assert matcher.match("What errors does the king make?")["names"] == []
+    assert matcher.match("Who are the twins in the Comedy of Errors?")["names"] == ["THE COMEDY OF ERRORS"]
+
+
+def test_henry_vi_alias_covers_all_three_parts():
+    henry_vi = [
+        "THE FIRST PART OF HENRY THE SIXTH",
+        "THE SECOND PART OF KING HENRY THE SIXTH",
+        "THE THIRD PART OF KING HENRY THE SIXTH",
+    ]
+    for title in henry_vi:
+        assert "henry vi" in title_aliases(title)
+    matcher = KeywordMatcher(henry_vi + ["THE LIFE OF KING HENRY THE FIFTH"])
+    assert sorted(matcher.match("Who is the queen in Henry VI?")["names"]) == sorted(henry_vi)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from utils.quantized_store import CODE_TYPES, QuantizedIndex, build_quantized_store
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((3000, 64)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    store_dir = tmp_path_factory.mktemp("quantized")
+    build_quantized_store(embeddings, str(store_dir))
+    return str(store_dir), embeddings
+
+
+@pytest.mark.parametrize("code_type", CODE_TYPES)
+def test_stored_vector_finds_itself(store, code_type):
+    store_dir, embeddings = store
+    index = QuantizedIndex(store_dir, code_type=code_type, rescore_k=50)
+    queries = embeddings[:20]
+    distances, indices = index.search(queries, 5)
+    assert indices[:, 0].tolist() == list(range(20))
+    np.testing.assert_allclose(distances[:, 0], 1.0, rtol=1e-5)
+
+
+def test_binary_scores_rank_closer_codes_higher(store):
+    store_dir, embeddings = store
+    index = QuantizedIndex(store_dir, code_type="binary")
+    scores = index._approximate_scores(embeddings[:1], np.arange(index.ntotal))
+    assert scores.dtype == np.float32
+    assert scores.max() == 0.0
+    assert scores[0, 0] == 0.0
+    assert (scores <= 0).all()
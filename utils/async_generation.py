@@ -0,0 +1,159 @@
+import asyncio
+import random
+import time
+import openai
+from utils.openai import GPT_MODEL, build_messages
+
+# Errors worth retrying: throttling, transient network failures and 5xx responses
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter: `rate` requests per second with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncGenerationClient:
+    """
+    Concurrent answer generation against the OpenAI chat completions API.
+
+    One `AsyncOpenAI` client is shared by every request so HTTP connections are reused. Requests
+    are bounded by a semaphore, paced by a token bucket, and retried with exponential backoff and
+    jitter on throttling and transient errors. Point `base_url` at `utils.openai_stub` to run
+    without the real API.
+    """
+
+    def __init__(self, api_key="", base_url=None, model=GPT_MODEL, max_concurrency=8, requests_per_second=5.0,
+                 max_retries=5, base_delay=0.5, max_delay=20.0, timeout=60.0, max_tokens=100, temperature=0.5):
+        """
+        Args:
+            api_key (str): OpenAI API key.
+            base_url (str): Optional API base URL, e.g. "http://127.0.0.1:8008/v1" for the stub server.
+            model (str): Chat model name.
+            max_concurrency (int): Maximum number of requests in flight.
+            requests_per_second (float): Sustained request rate allowed by the token bucket.
+            max_retries (int): Retries per request after the first attempt.
+            base_delay (float): Backoff delay in seconds before the first retry; doubles per retry.
+            max_delay (float): Upper bound on a single backoff delay.
+            timeout (float): Per-request timeout in seconds.
+            max_tokens (int): Completion token limit.
+            temperature (float): Sampling temperature.
+        """
+        # Retries are handled here, with jitter and the shared rate limiter, not by the SDK
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+        self.model = model
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.retries = 0
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _generate(self, query, passages, semaphore, bucket):
+        messages = build_messages(query, passages)
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=self.max_tokens,
+                        temperature=self.temperature
+                    )
+                    return response.choices[0].message.content
+                except RETRYABLE_ERRORS as error:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    delay = self._backoff(attempt, error)
+            # Sleep outside the semaphore so a backing-off request does not hold a slot
+            await asyncio.sleep(delay)
+
+    async def generate_many(self, queries, passages):
+        """
+        Generate answers for many queries concurrently.
+
+        Args:
+            queries (list): Query strings.
+            passages (list): Retrieved passages for each query.
+
+        Returns:
+            list: Answers in input order. A request that still fails after all retries yields the
+            exception object in its slot instead of failing the whole batch.
+        """
+        # Created here so they bind to the running event loop
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        bucket = TokenBucket(self.requests_per_second)
+        return await asyncio.gather(
+            *(self._generate(query, query_passages, semaphore, bucket) for query, query_passages in zip(queries, passages)),
+            return_exceptions=True
+        )
+
+    async def close(self):
+        await self.client.close()
+
+
+async def generate_answers_async(queries, passages, **client_kwargs):
+    """
+    Generate GPT answers for many queries concurrently.
+
+    Args:
+        queries (list): Query strings.
+        passages (list): Retrieved passages for each query.
+        **client_kwargs: Passed to `AsyncGenerationClient` (concurrency, rate, retries, base_url, ...).
+
+    Returns:
+        list: Answers in input order; failed requests are returned as exception objects.
+    """
+    client = AsyncGenerationClient(**client_kwargs)
+    try:
+        return await client.generate_many(queries, passages)
+    finally:
+        await client.close()
+
+
+def generate_answers(queries, passages, **client_kwargs):
+    """
+    Blocking wrapper around `generate_answers_async` for scripts without an event loop.
+    """
+    return asyncio.run(generate_answers_async(queries, passages, **client_kwargs))
@@ -0,0 +1,109 @@
+import re
+from collections import Counter
+import numpy as np
+from utils import metrics
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)*")
+
+
+def tokenize(text):
+    """
+    Lowercase word tokenizer shared by indexing and querying. Stopwords are kept on purpose:
+    lines like "To be, or not to be" are made of nothing else.
+    """
+    return _TOKEN_PATTERN.findall(text.lower().replace("’", "'"))
+
+
+class BM25Index:
+    """
+    In-memory inverted index with BM25 scoring.
+
+    Postings are stored in CSR form (one contiguous doc-id array and one weight array, sliced by
+    term offsets) and each posting's full BM25 contribution is precomputed at build time, so a
+    query is a handful of vectorised scatter-adds rather than a scan over chunk text.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        """
+        Args:
+            texts (iterable): Document texts, in index order.
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 length normalisation.
+        """
+        self.vocabulary = {}
+        term_ids = []
+        doc_ids = []
+        term_freqs = []
+        doc_lengths = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+
+        self.num_docs = len(doc_lengths)
+        doc_lengths = np.array(doc_lengths, dtype=np.float32)
+        term_ids = np.array(term_ids, dtype=np.int32)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        term_freqs = np.array(term_freqs, dtype=np.float32)
+
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        self.doc_ids = doc_ids[order]
+        term_freqs = term_freqs[order]
+
+        doc_freqs = np.bincount(term_ids, minlength=len(self.vocabulary))
+        self.term_offsets = np.concatenate([[0], np.cumsum(doc_freqs)]).astype(np.int64)
+
+        idf = np.log(1 + (self.num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_length = doc_lengths.mean() if self.num_docs else 1.0
+        length_norm = k1 * (1 - b + b * doc_lengths[self.doc_ids] / avg_length)
+        self.weights = (idf[term_ids] * term_freqs * (k1 + 1) / (term_freqs + length_norm)).astype(np.float32)
+
+    def scores(self, query):
+        """
+        Score every document against the query.
+
+        Args:
+            query (str): Query text.
+
+        Returns:
+            np.ndarray: float32 BM25 score per document.
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for token, count in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            # Each doc appears at most once per term, so a fancy-indexed add is safe
+            scores[self.doc_ids[start:end]] += count * self.weights[start:end]
+        return scores
+
+    @metrics.traced("bm25_search")
+    def search(self, query, top_k, ids=None):
+        """
+        Return the top-k documents by BM25 score.
+
+        Args:
+            query (str): Query text.
+            top_k (int): Number of results.
+            ids (np.ndarray): Optional document positions to restrict the search to.
+
+        Returns:
+            tuple: (scores, positions) arrays sorted by descending score; zero-score documents are dropped.
+        """
+        scores = self.scores(query)
+        positions = np.arange(self.num_docs) if ids is None else ids
+        candidate_scores = scores if ids is None else scores[ids]
+
+        top_k = min(top_k, len(candidate_scores))
+        if top_k == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        top = np.argpartition(-candidate_scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-candidate_scores[top], kind="stable")]
+        top = top[candidate_scores[top] > 0]
+        return candidate_scores[top], positions[top]
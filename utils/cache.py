@@ -0,0 +1,225 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from utils import metrics
+
+
+def normalize_query(query):
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+
+    Folds Unicode compatibility forms and curly quotes, lowercases, collapses whitespace
+    and drops trailing punctuation.
+
+    Args:
+        query (str): The user query.
+
+    Returns:
+        str: Normalized query text.
+    """
+    query = unicodedata.normalize("NFKC", query)
+    query = query.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.rstrip("?!. ")
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU mapping with hit/miss counters.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count, hits, misses and hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class TTLCache(LRUCache):
+    """
+    Bounded LRU mapping whose entries also expire `ttl` seconds after being stored.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600):
+        super().__init__(max_size)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            with self._lock:
+                self._data.pop(key, None)
+                # Count the expired lookup as a miss, not a hit
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def put(self, key, value):
+        super().put(key, (time.monotonic() + self.ttl, value))
+
+
+def answer_cache_key(query, top_k, results, model_version):
+    """
+    Build the answer-cache key for a query and the passages retrieved for it.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of passages retrieved.
+        results (list): Retrieved passages, each with an "id".
+        model_version (str): Generator model and prompt version.
+
+    Returns:
+        tuple: Hashable cache key.
+    """
+    return (normalize_query(query), top_k, tuple(result["id"] for result in results), model_version)
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache of query embeddings in front of an encoder, with an optional SQLite tier that
+    survives restarts.
+    """
+
+    def __init__(self, encode_fn, model_name="all-MiniLM-L6-v2", max_size=1024, db_path=None):
+        """
+        Args:
+            encode_fn (function): Maps a list of strings to an (n, dimension) array.
+            model_name (str): Name of the embedding model; persisted vectors are scoped to it.
+            max_size (int): Maximum number of embeddings held in memory.
+            db_path (str): Optional SQLite file for the persistent tier.
+        """
+        self.encode_fn = encode_fn
+        self.model_name = model_name
+        self.memory = LRUCache(max_size)
+        self.persistent_hits = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def _load_persistent(self, keys):
+        if self._db is None or not keys:
+            return {}
+        rows = []
+        with self._db_lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._db.execute(
+                    f"SELECT query, vector FROM query_embeddings WHERE model = ? AND query IN ({placeholders})",
+                    [self.model_name, *batch]
+                ).fetchall())
+        return {query: np.frombuffer(vector, dtype=np.float32) for query, vector in rows}
+
+    def _store_persistent(self, items):
+        if self._db is None or not items:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, vector) VALUES (?, ?, ?)",
+                [(self.model_name, key, vector.astype(np.float32).tobytes()) for key, vector in items]
+            )
+            self._db.commit()
+
+    def encode(self, queries):
+        """
+        Embed queries, encoding only those found in neither cache tier, in one batched call.
+
+        Args:
+            queries (list): Query strings.
+
+        Returns:
+            np.ndarray: float32 embeddings of shape (len(queries), dimension).
+        """
+        keys = [normalize_query(query) for query in queries]
+        vectors = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            vector = self.memory.get(key)
+            if vector is None:
+                missing.append(key)
+            else:
+                vectors[key] = vector
+
+        metrics.increment("query_embedding_cache_hits_total", len(vectors))
+        metrics.increment("query_embedding_cache_misses_total", len(missing))
+        if missing:
+            found = self._load_persistent(missing)
+            self.persistent_hits += len(found)
+            for key, vector in found.items():
+                self.memory.put(key, vector)
+            vectors.update(found)
+
+            # The normalized text is what gets encoded; MiniLM lowercases its input anyway
+            to_encode = [key for key in missing if key not in found]
+            if to_encode:
+                encoded = np.asarray(self.encode_fn(to_encode), dtype=np.float32)
+                new_items = list(zip(to_encode, encoded))
+                for key, vector in new_items:
+                    self.memory.put(key, vector)
+                    vectors[key] = vector
+                self._store_persistent(new_items)
+
+        return np.stack([vectors[key] for key in keys])
+
+    def stats(self):
+        """
+        Returns:
+            dict: In-memory LRU statistics plus persistent-tier hits.
+        """
+        stats = self.memory.stats()
+        stats["persistent_hits"] = self.persistent_hits
+        return stats
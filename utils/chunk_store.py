@@ -0,0 +1,246 @@
+import bisect
+import json
+import mmap
+import os
+import re
+from collections.abc import Mapping
+import numpy as np
+
+_CHUNK_SUFFIX = re.compile(r"_(?:chunk|unit)_\d+$")
+
+
+def build_chunk_store(chunks, store_dir):
+    """
+    Write chunks with metadata to a compact columnar store.
+
+    Layout of `store_dir`:
+        contents.bin     UTF-8 contents of every chunk, concatenated
+        offsets.npy      int64 byte offsets into contents.bin (n + 1 entries)
+        title_codes.npy  int32 index into the title table, per chunk
+        genre_codes.npy  int8 index into the genre table, per chunk
+        author_codes.npy int8 index into the author table, per chunk
+        book_codes.npy   int32 index into the book ID table, per chunk
+        meta.json        chunk IDs and names plus the title/genre/author/book tables
+
+    Chunks from the structure-aware chunker also get:
+        act_codes.npy, scene_codes.npy    int16 index into the act/scene tables (which include null)
+        line_starts.npy, line_ends.npy    int32 1-based line range within the book
+        speaker_codes.npy                 int32 index into the speaker table, per speaker of every chunk;
+                                          speaker_offsets.npy holds n + 1 offsets into it
+
+    Args:
+        chunks (list): Chunks with "id", "name", "contents" and "metadata" (title, author, genre, and
+            act, scene, speakers, line_start and line_end for structured chunks).
+        store_dir (str): Output directory.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+
+    tables = {"title": {}, "genre": {}, "author": {}, "book": {}, "act": {}, "scene": {}, "speaker": {}}
+    codes = {"title": [], "genre": [], "author": [], "book": [], "act": [], "scene": [], "speaker": []}
+    line_ranges = []
+    speaker_offsets = [0]
+    structured = False
+    ids = []
+    names = []
+    offsets = [0]
+
+    with open(os.path.join(store_dir, "contents.bin"), "wb") as file:
+        for chunk in chunks:
+            encoded = chunk["contents"].encode("utf-8")
+            file.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            ids.append(chunk["id"])
+            names.append(chunk["name"])
+            metadata = chunk["metadata"]
+            for field in ("title", "genre", "author"):
+                codes[field].append(tables[field].setdefault(metadata[field], len(tables[field])))
+            book_id = chunk.get("book_id") or _CHUNK_SUFFIX.sub("", chunk["id"])
+            codes["book"].append(tables["book"].setdefault(book_id, len(tables["book"])))
+
+            # Structural fields; word-window chunks leave them empty
+            structured = structured or "line_start" in metadata
+            for field in ("act", "scene"):
+                codes[field].append(tables[field].setdefault(metadata.get(field), len(tables[field])))
+            for speaker in metadata.get("speakers", []):
+                codes["speaker"].append(tables["speaker"].setdefault(speaker, len(tables["speaker"])))
+            speaker_offsets.append(len(codes["speaker"]))
+            line_ranges.append((metadata.get("line_start", 0), metadata.get("line_end", 0)))
+
+    np.save(os.path.join(store_dir, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(store_dir, "title_codes.npy"), np.array(codes["title"], dtype=np.int32))
+    np.save(os.path.join(store_dir, "genre_codes.npy"), np.array(codes["genre"], dtype=np.int8))
+    np.save(os.path.join(store_dir, "author_codes.npy"), np.array(codes["author"], dtype=np.int8))
+    np.save(os.path.join(store_dir, "book_codes.npy"), np.array(codes["book"], dtype=np.int32))
+
+    meta = {
+        "ids": ids,
+        "names": names,
+        "titles": list(tables["title"]),
+        "genres": list(tables["genre"]),
+        "authors": list(tables["author"]),
+        "book_ids": list(tables["book"]),
+        "structured": structured
+    }
+    if structured:
+        line_ranges = np.array(line_ranges, dtype=np.int32).reshape(-1, 2)
+        np.save(os.path.join(store_dir, "act_codes.npy"), np.array(codes["act"], dtype=np.int16))
+        np.save(os.path.join(store_dir, "scene_codes.npy"), np.array(codes["scene"], dtype=np.int16))
+        np.save(os.path.join(store_dir, "line_starts.npy"), line_ranges[:, 0])
+        np.save(os.path.join(store_dir, "line_ends.npy"), line_ranges[:, 1])
+        np.save(os.path.join(store_dir, "speaker_codes.npy"), np.array(codes["speaker"], dtype=np.int32))
+        np.save(os.path.join(store_dir, "speaker_offsets.npy"), np.array(speaker_offsets, dtype=np.int64))
+        meta.update({"acts": list(tables["act"]), "scenes": list(tables["scene"]), "speakers": list(tables["speaker"])})
+
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file, ensure_ascii=False)
+
+
+class Chunk(Mapping):
+    """
+    Read-only view of one stored chunk. Behaves like the chunk dicts in the JSON metadata file,
+    but the contents are only decoded when "contents" is accessed.
+    """
+
+    _KEYS = ("id", "name", "contents", "metadata")
+
+    def __init__(self, store, position):
+        self._store = store
+        self._position = position
+
+    def __getitem__(self, key):
+        store, position = self._store, self._position
+        if key == "id":
+            return store.ids[position]
+        if key == "name":
+            return store.names[position]
+        if key == "contents":
+            return store.contents(position)
+        if key == "metadata":
+            return store.metadata(position)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+
+class ChunkStore:
+    """
+    Memory-mapped chunk store written by `build_chunk_store`.
+
+    Indexing returns lazy `Chunk` views, so code written against the list of chunk dicts keeps
+    working while only the chunks actually shown (the top-k hits) have their text materialized.
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): Directory written by `build_chunk_store`.
+        """
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.ids = meta["ids"]
+        self.names = meta["names"]
+        self.titles = meta["titles"]
+        self.genres = meta["genres"]
+        self.authors = meta["authors"]
+
+        self.offsets = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode="r")
+        self.title_codes = np.load(os.path.join(store_dir, "title_codes.npy"), mmap_mode="r")
+        self.genre_codes = np.load(os.path.join(store_dir, "genre_codes.npy"), mmap_mode="r")
+        self.author_codes = np.load(os.path.join(store_dir, "author_codes.npy"), mmap_mode="r")
+
+        # Stores written before the book and structure columns existed have neither
+        self.book_ids = meta.get("book_ids")
+        self.book_codes = (
+            np.load(os.path.join(store_dir, "book_codes.npy"), mmap_mode="r") if self.book_ids is not None else None
+        )
+        self.structured = meta.get("structured", False)
+        if self.structured:
+            self.acts = meta["acts"]
+            self.scenes = meta["scenes"]
+            self.speakers = meta["speakers"]
+            for column in ("act_codes", "scene_codes", "line_starts", "line_ends", "speaker_codes", "speaker_offsets"):
+                setattr(self, column, np.load(os.path.join(store_dir, f"{column}.npy"), mmap_mode="r"))
+        self._line_lookup = None
+
+        contents_path = os.path.join(store_dir, "contents.bin")
+        if os.path.getsize(contents_path) == 0:
+            self._blob = b""
+        else:
+            with open(contents_path, "rb") as file:
+                self._blob = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("chunk position out of range")
+        return Chunk(self, int(position))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield Chunk(self, position)
+
+    def contents(self, position):
+        """
+        Decode the contents of one chunk from the memory-mapped blob.
+        """
+        return self._blob[self.offsets[position]:self.offsets[position + 1]].decode("utf-8")
+
+    def metadata(self, position):
+        """
+        Build the metadata dict of one chunk from the code columns.
+        """
+        metadata = {
+            "title": self.titles[self.title_codes[position]],
+            "author": self.authors[self.author_codes[position]],
+            "genre": self.genres[self.genre_codes[position]]
+        }
+        if self.structured and self.line_starts[position]:
+            speakers = self.speaker_codes[self.speaker_offsets[position]:self.speaker_offsets[position + 1]]
+            metadata.update({
+                "act": self.acts[self.act_codes[position]],
+                "scene": self.scenes[self.scene_codes[position]],
+                "speakers": [self.speakers[code] for code in speakers],
+                "line_start": int(self.line_starts[position]),
+                "line_end": int(self.line_ends[position])
+            })
+        return metadata
+
+    def position_for_line(self, book_id, line_number):
+        """
+        Find the chunk covering a line of a book, from the stored line ranges.
+
+        Args:
+            book_id (str): Book ID, e.g. "book_7".
+            line_number (int): 1-based line number within the book.
+
+        Returns:
+            int or None: Position of the chunk, or None when the store has no line ranges for the
+            book (word-window chunks) or no chunk covers the line.
+        """
+        if not self.structured or self.book_ids is None:
+            return None
+        if self._line_lookup is None:
+            # Per book: chunk line starts in ascending order and the matching positions
+            lookup = {}
+            for position in np.flatnonzero(np.asarray(self.line_starts) > 0):
+                lookup.setdefault(self.book_ids[self.book_codes[position]], []).append(
+                    (int(self.line_starts[position]), int(position))
+                )
+            self._line_lookup = {book: sorted(entries) for book, entries in lookup.items()}
+
+        entries = self._line_lookup.get(book_id)
+        if not entries:
+            return None
+        i = bisect.bisect_right(entries, (line_number, len(self))) - 1
+        if i < 0:
+            return None
+        position = entries[i][1]
+        return position if line_number <= self.line_ends[position] else None
@@ -1,3 +1,5 @@
+import re
+
 def chunk_text_by_words(text, max_words=400, overlap=40):
     """
     Chunk text into fixed word sizes with overlap.
@@ -9,4 +11,191 @@ def chunk_text_by_words(text, max_words=400, overlap=40):
         chunk = words[i:i + max_words]
         chunks.append(" ".join(chunk))
 
-    return chunks
\ No newline at end of file
+    return chunks
+
+def chunk_books(books, max_words=400, overlap=40):
+    """
+    Chunk a stream of books, yielding chunks as each book is read.
+
+    Sonnets are kept whole; other books are split with `chunk_text_by_words`.
+
+    Args:
+        books (iterable): Books with "id", "name" and "contents", e.g. from `parsing.iter_books`.
+        max_words (int): Maximum words per chunk.
+        overlap (int): Words shared by consecutive chunks.
+
+    Yields:
+        dict: Chunks with "id", "name" and "contents".
+    """
+    for book in books:
+        if "sonnet" in book["id"]:
+            # Treat each sonnet as a single chunk
+            yield {
+                "id": book["id"],
+                "name": book["name"],
+                "contents": book["contents"]
+            }
+            continue
+
+        for idx, chunk in enumerate(chunk_text_by_words(book["contents"], max_words=max_words, overlap=overlap)):
+            yield {
+                "id": f"{book['id']}_chunk_{idx + 1}",
+                "name": f"{book['name']} (Chunk {idx + 1})",
+                "contents": chunk
+            }
+
+_ACT_HEADING = re.compile(r"^ACT ([IVXL]+)\b")
+# Prologues, epilogues and inductions are scene-level units of the current act (if any)
+_SCENE_HEADING = re.compile(r"^(?:SCENE ([IVXL]+)|(PROLOGUE|EPILOGUE|INDUCTION))\b")
+_SPEAKER_LABEL = re.compile(r"^([A-Z][A-Z’'&,\- ]*[A-Z])\.\s*$")
+
+def _segments(lines):
+    # Split a work into speeches (plays) or stanzas (poems): (act, scene, speaker, first line, last line)
+    is_play = any(_ACT_HEADING.match(line) for line in lines) and any(_SPEAKER_LABEL.match(line) for line in lines)
+    act = scene = speaker = None
+    start = None
+    segments = []
+
+    def close(end):
+        while start is not None and end >= start and not lines[end].strip():
+            end -= 1
+        if start is not None and end >= start:
+            segments.append((act, scene, speaker, start, end))
+
+    for i, line in enumerate(lines):
+        if is_play:
+            act_match = _ACT_HEADING.match(line)
+            scene_match = _SCENE_HEADING.match(line)
+            if scene_match or act_match:
+                close(i - 1)
+                speaker = None
+                if scene_match:
+                    # The scene heading opens the scene's first unit, as context for its stage directions
+                    scene, start = scene_match.group(1) or scene_match.group(2).title(), i
+                else:
+                    # The act is recorded in the metadata; its heading line is not worth a unit
+                    act, scene, start = act_match.group(1), None, None
+                continue
+            speaker_match = _SPEAKER_LABEL.match(line)
+            if speaker_match:
+                close(i - 1)
+                speaker, start = speaker_match.group(1), i
+                continue
+        elif not line.strip():
+            close(i - 1)
+            start = None
+            continue
+        if start is None and line.strip():
+            start = i
+    close(len(lines) - 1)
+    return is_play, segments
+
+def chunk_book_by_structure(book, max_words=200, author="William Shakespeare"):
+    """
+    Chunk one parsed work along its own structure instead of fixed word windows.
+
+    Plays are split into speeches and packed into chunks that never cross a scene boundary; poems
+    are split into stanzas; sonnets stay whole. A speech or stanza longer than `max_words` is split
+    between lines, so no line is ever cut. Chunks point into the book text by character offsets
+    rather than holding a copy of it (see `chunk_contents`), and there is no overlap.
+
+    Args:
+        book (dict): Parsed book with "id", "name" and "contents".
+        max_words (int): Word ceiling per chunk (a single longer line is kept whole).
+        author (str): Author recorded in the metadata.
+
+    Returns:
+        list: Chunks with "id", "name", "book_id", "start" and "end" (character offsets into the
+        book contents) and "metadata" (title, author, genre, act, scene, speakers and the 1-based
+        line_start/line_end within the book).
+    """
+    contents = book["contents"]
+    lines = contents.split("\n")
+    line_offsets = [0]
+    for line in lines:
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    def make_chunk(act, scene, speakers, first, last):
+        location = ", ".join(part for part in (f"Act {act}" if act else None, f"Scene {scene}" if scene else None) if part)
+        number = len(chunks) + 1
+        chunks.append({
+            "id": f"{book['id']}_unit_{number}",
+            "name": f"{book['name']} ({location or f'Part {number}'})",
+            "book_id": book["id"],
+            "start": line_offsets[first],
+            "end": line_offsets[last] + len(lines[last]),
+            "metadata": {
+                "title": book["name"],
+                "author": author,
+                "genre": genre,
+                "act": act,
+                "scene": scene,
+                "speakers": list(dict.fromkeys(speaker for speaker in speakers if speaker)),
+                "line_start": first + 1,
+                "line_end": last + 1
+            }
+        })
+
+    chunks = []
+    if "sonnet" in book["id"]:
+        genre = "Sonnet"
+        make_chunk(None, None, [], 0, len(lines) - 1)
+        # A sonnet is a single chunk under its own ID and name, as in `chunk_books`
+        chunks[0].update({"id": book["id"], "name": book["name"]})
+        return chunks
+
+    is_play, segments = _segments(lines)
+    genre = "Play" if is_play else "Poem"
+    word_counts = [len(line.split()) for line in lines]
+
+    # Pack whole segments while they fit; split oversized segments between lines
+    current = None  # [act, scene, speakers, first, last, words]
+    for act, scene, speaker, first, last in segments:
+        words = sum(word_counts[first:last + 1])
+        if words == 0:
+            continue
+        if current and (current[:2] != [act, scene] or current[5] + words > max_words):
+            make_chunk(*current[:5])
+            current = None
+        if words <= max_words:
+            if current is None:
+                current = [act, scene, [speaker], first, last, words]
+            else:
+                current[2].append(speaker)
+                current[4], current[5] = last, current[5] + words
+            continue
+
+        piece_start, piece_words = first, 0
+        for i in range(first, last + 1):
+            if piece_words and piece_words + word_counts[i] > max_words:
+                make_chunk(act, scene, [speaker], piece_start, i - 1)
+                piece_start, piece_words = i, 0
+            piece_words += word_counts[i]
+        current = [act, scene, [speaker], piece_start, last, piece_words]
+    if current:
+        make_chunk(*current[:5])
+    return chunks
+
+def chunk_contents(book, chunk):
+    """
+    Materialize the text of a chunk produced by `chunk_book_by_structure`, line breaks included.
+    """
+    return book["contents"][chunk["start"]:chunk["end"]].strip()
+
+def chunk_books_by_structure(books, max_words=200, with_contents=True):
+    """
+    Structure-aware counterpart of `chunk_books`, for a stream of parsed books.
+
+    Args:
+        books (iterable): Books with "id", "name" and "contents", e.g. from `parsing.iter_books`.
+        max_words (int): Word ceiling per chunk.
+        with_contents (bool): Add "contents" (sliced from the book) for the embedding and chunk-store steps.
+
+    Yields:
+        dict: Chunks as returned by `chunk_book_by_structure`.
+    """
+    for book in books:
+        for chunk in chunk_book_by_structure(book, max_words=max_words):
+            if with_contents:
+                chunk["contents"] = chunk_contents(book, chunk)
+            yield chunk
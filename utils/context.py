@@ -0,0 +1,98 @@
+import math
+import re
+from collections import Counter
+from utils.bm25 import tokenize
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def approximate_token_count(text):
+    """
+    Rough token count (about 4 tokens per 3 words) for when the model tokenizer is unavailable.
+    """
+    return len(text.split()) * 4 // 3 + 1
+
+
+def split_sentences(text, max_words=40):
+    """
+    Split chunk text into sentences, cutting very long ones into `max_words` pieces.
+
+    Chunks are whitespace-joined words without line breaks, so sentence punctuation is the only
+    structure left to split on.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        words = sentence.split()
+        for start in range(0, len(words), max_words):
+            sentences.append(" ".join(words[start:start + max_words]))
+    return sentences
+
+
+def _passage_words(passages, overlap):
+    # Drop the leading words a chunk shares with the end of another retrieved chunk (the chunker overlap)
+    words = [passage["contents"].split() for passage in passages]
+    tails = {tuple(passage_words[-overlap:]) for passage_words in words if len(passage_words) > overlap}
+    return [
+        passage_words[overlap:] if overlap and tuple(passage_words[:overlap]) in tails else passage_words
+        for passage_words in words
+    ]
+
+
+def pack_context(query, passages, count_tokens=None, token_budget=768, overlap=40):
+    """
+    Pack the most query-relevant sentences of the retrieved passages into a token budget.
+
+    Sentences are scored by the IDF-weighted query terms they contain (IDF over the sentences of
+    all passages), duplicates and chunk overlaps are dropped, and sentences are taken best first
+    until the budget is spent. Ties go to higher-ranked passages and earlier sentences, so a query
+    with no lexical overlap gets the opening of the top passages.
+
+    Args:
+        query (str): The user query.
+        passages (list): Retrieved passages with "contents" and, optionally, "metadata"/"name".
+        count_tokens (function): Token counter of the target model; defaults to an approximation.
+        token_budget (int): Maximum tokens of packed passage text.
+        overlap (int): Word overlap between adjacent chunks.
+
+    Returns:
+        list: One packed text per passage that kept at least one sentence, in rank order.
+    """
+    count_tokens = count_tokens or approximate_token_count
+    query_terms = set(tokenize(query))
+
+    units = []
+    seen = set()
+    for rank, words in enumerate(_passage_words(passages, overlap)):
+        for position, sentence in enumerate(split_sentences(" ".join(words))):
+            key = " ".join(tokenize(sentence))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            units.append((rank, position, sentence, query_terms.intersection(tokenize(sentence))))
+
+    document_frequency = Counter(term for *_, terms in units for term in terms)
+    idf = {term: math.log(1 + len(units) / count) for term, count in document_frequency.items()}
+
+    order = sorted(units, key=lambda unit: (-sum(idf[term] for term in unit[3]), unit[0], unit[1]))
+    selected = {}
+    used = 0
+    for rank, position, sentence, _ in order:
+        cost = count_tokens(sentence)
+        if used + cost > token_budget:
+            continue
+        selected.setdefault(rank, []).append((position, sentence))
+        used += cost
+
+    packed = []
+    for rank in sorted(selected):
+        passage = passages[rank]
+        title = passage.get("metadata", {}).get("title") or passage.get("name", "")
+        text = ""
+        previous = None
+        for position, sentence in sorted(selected[rank]):
+            if previous is not None and position != previous + 1:
+                text += " ..."
+            text += (" " if text else "") + sentence
+            previous = position
+        packed.append(f"({title}) {text}" if title else text)
+    return packed
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    On-disk cache of chunk embeddings keyed by a hash of the chunk contents and the model name.
+
+    Vectors live in a memory-mappable `embeddings.npy` and the row order is recorded in a sidecar
+    `manifest.json`, so an index rebuild only embeds chunks whose contents changed.
+    """
+
+    def __init__(self, store_dir, model_name):
+        """
+        Args:
+            store_dir (str): Directory holding `embeddings.npy` and `manifest.json`.
+            model_name (str): Name of the embedding model; part of every key.
+        """
+        self.store_dir = store_dir
+        self.model_name = model_name
+        self.embeddings_path = os.path.join(store_dir, "embeddings.npy")
+        self.manifest_path = os.path.join(store_dir, "manifest.json")
+
+        self._keys = []
+        self._rows = {}
+        self._embeddings = None
+
+        if os.path.exists(self.manifest_path) and os.path.exists(self.embeddings_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if manifest["model_name"] != model_name:
+                print(f"Embedding store at {store_dir} was built with {manifest['model_name']}, starting empty.")
+            else:
+                self._keys = manifest["keys"]
+                self._rows = {key: row for row, key in enumerate(self._keys)}
+                self._embeddings = np.load(self.embeddings_path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def content_hash(self, text):
+        """
+        Compute the store key for a chunk's contents.
+
+        Args:
+            text (str): Chunk contents.
+
+        Returns:
+            str: Hex digest of the model name and contents.
+        """
+        digest = hashlib.sha1()
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_or_compute(self, texts, encode_fn):
+        """
+        Return embeddings for `texts`, encoding only those missing from the store.
+
+        Args:
+            texts (list): Chunk contents, in index order.
+            encode_fn (function): Maps a list of strings to an (n, dimension) array.
+
+        Returns:
+            np.ndarray: float32 embeddings of shape (len(texts), dimension).
+        """
+        keys = [self.content_hash(text) for text in texts]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+
+        print(f"Embedding store: {len(texts) - len(missing)} cached, {len(missing)} to embed.")
+        if missing:
+            new_embeddings = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            self._append(list(missing.keys()), new_embeddings)
+
+        rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.ascontiguousarray(self._embeddings[rows], dtype=np.float32)
+
+    def _append(self, keys, embeddings):
+        if self._embeddings is not None and len(self._embeddings):
+            embeddings = np.concatenate([self._embeddings, embeddings])
+        self._write(self._keys + keys, embeddings)
+
+    def compact(self, texts):
+        """
+        Drop every vector not used by `texts`, e.g. after a chunking change settles.
+
+        Args:
+            texts (list): Chunk contents to keep.
+        """
+        if self._embeddings is None:
+            return
+        keep = {self.content_hash(text) for text in texts}
+        keys = [key for key in self._keys if key in keep]
+        if len(keys) == len(self._keys):
+            return
+        print(f"Embedding store: dropping {len(self._keys) - len(keys)} unused vectors.")
+        rows = np.array([self._rows[key] for key in keys], dtype=np.int64)
+        self._write(keys, np.ascontiguousarray(self._embeddings[rows]))
+
+    def _write(self, keys, embeddings):
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        # Write to temporary files first so an interrupted build never leaves a torn store
+        tmp_embeddings = self.embeddings_path + ".tmp.npy"
+        tmp_manifest = self.manifest_path + ".tmp"
+        np.save(tmp_embeddings, embeddings.astype(np.float32, copy=False))
+        with open(tmp_manifest, "w", encoding="utf-8") as file:
+            json.dump({
+                "model_name": self.model_name,
+                "dimension": int(embeddings.shape[1]),
+                "keys": keys
+            }, file)
+        os.replace(tmp_embeddings, self.embeddings_path)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        self._keys = keys
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._embeddings = np.load(self.embeddings_path, mmap_mode="r")
@@ -0,0 +1,145 @@
+import numpy as np
+import faiss
+from utils import metrics
+from utils.quantized_store import QuantizedIndex
+
+
+def search_parameters(index, selector):
+    """
+    Build FAISS search parameters carrying an ID selector, keeping the index's own nprobe/efSearch.
+
+    Args:
+        index (faiss.Index): The index being searched.
+        selector (faiss.IDSelector): Selector restricting the search.
+
+    Returns:
+        faiss.SearchParameters: Parameters of the type the index expects.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+class FilteredIndex:
+    """
+    Search a prebuilt FAISS index restricted to chunks matching a title and/or genre filter.
+
+    The chunk positions for every title and genre are grouped once at load time, so a filtered
+    query only needs one query encode and one `index.search` with an ID selector, instead of
+    re-embedding the surviving chunks.
+    """
+
+    def __init__(self, index, chunks_with_metadata):
+        """
+        Args:
+            index (faiss.Index or QuantizedIndex): Index built over the chunks, in the same order as `chunks_with_metadata`.
+            chunks_with_metadata (ChunkStore or list): Chunks with a "metadata" dict holding "title" and "genre".
+        """
+        if index.ntotal != len(chunks_with_metadata):
+            raise ValueError(
+                f"Index holds {index.ntotal} vectors but there are {len(chunks_with_metadata)} chunks."
+            )
+
+        self.index = index
+        self.ntotal = index.ntotal
+
+        if hasattr(chunks_with_metadata, "title_codes"):
+            # ChunkStore: group by the code columns without touching the chunks themselves
+            title_codes = np.asarray(chunks_with_metadata.title_codes)
+            genre_codes = np.asarray(chunks_with_metadata.genre_codes)
+            self.title_groups = {
+                title: np.flatnonzero(title_codes == code).astype(np.int64)
+                for code, title in enumerate(chunks_with_metadata.titles)
+            }
+            self.genre_groups = {}
+            for code, genre in enumerate(chunks_with_metadata.genres):
+                ids = np.flatnonzero(genre_codes == code).astype(np.int64)
+                self.genre_groups[genre.lower()] = np.union1d(self.genre_groups.get(genre.lower(), ids), ids)
+        else:
+            title_groups = {}
+            genre_groups = {}
+            for position, chunk in enumerate(chunks_with_metadata):
+                title_groups.setdefault(chunk["metadata"]["title"], []).append(position)
+                genre_groups.setdefault(chunk["metadata"]["genre"].lower(), []).append(position)
+
+            self.title_groups = {title: np.array(ids, dtype=np.int64) for title, ids in title_groups.items()}
+            self.genre_groups = {genre: np.array(ids, dtype=np.int64) for genre, ids in genre_groups.items()}
+
+        # (filter_title, filter_genre) -> (ids, selector); the ids array must outlive the selector
+        self._selectors = {}
+
+    def filter_ids(self, filter_title=None, filter_genre=None):
+        """
+        Resolve a title/genre filter to the sorted chunk positions it matches.
+
+        Args:
+            filter_title (str or list): Optional title, or list of titles whose matches are combined.
+                A title equal to a chunk title (case-insensitive) selects exactly that title, so
+                "Sonnet 1" does not pull in "Sonnet 10"; otherwise it matches as a substring.
+            filter_genre (str): Optional genre (case-insensitive exact match).
+
+        Returns:
+            np.ndarray or None: Matching positions, or None when the filter is empty, matches
+            nothing, or matches the whole corpus (callers then search everything).
+        """
+        if not filter_title and not filter_genre:
+            return None
+
+        ids = None
+        if filter_title:
+            groups = []
+            for needle in ([filter_title] if isinstance(filter_title, str) else filter_title):
+                needle = needle.lower()
+                exact = [group for title, group in self.title_groups.items() if title.lower() == needle]
+                groups.extend(exact or [group for title, group in self.title_groups.items() if needle in title.lower()])
+            ids = np.unique(np.concatenate(groups)) if groups else np.empty(0, dtype=np.int64)
+        if filter_genre:
+            genre_ids = self.genre_groups.get(filter_genre.lower(), np.empty(0, dtype=np.int64))
+            ids = genre_ids if ids is None else np.intersect1d(ids, genre_ids, assume_unique=True)
+
+        if len(ids) == 0 or len(ids) == self.ntotal:
+            return None
+        return ids
+
+    def _filter(self, filter_title, filter_genre):
+        # (ids, selector) for a filter, cached; selector is None for quantized indexes
+        if isinstance(filter_title, str):
+            filter_title = [filter_title]
+        titles = tuple(sorted(title.lower() for title in filter_title)) if filter_title else None
+        key = (titles, filter_genre.lower() if filter_genre else None)
+        if key not in self._selectors:
+            ids = self.filter_ids(filter_title, filter_genre)
+            selector = None
+            if ids is not None and not isinstance(self.index, QuantizedIndex):
+                selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+            self._selectors[key] = (ids, selector)
+        return self._selectors[key]
+
+    @metrics.traced("faiss_search")
+    def search(self, query_embeddings, top_k, filter_title=None, filter_genre=None):
+        """
+        Search the index, optionally restricted to the chunks matching the filter.
+
+        Args:
+            query_embeddings (np.ndarray): Query matrix of shape (n, dimension).
+            top_k (int): Number of results per query.
+            filter_title (str or list): Optional title filter.
+            filter_genre (str): Optional genre filter.
+
+        Returns:
+            tuple: (distances, indices) arrays of shape (n, top_k). Missing results are marked with -1.
+        """
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        ids, selector = self._filter(filter_title, filter_genre)
+        if ids is None:
+            if filter_title or filter_genre:
+                # The filter matched nothing (or everything): the whole corpus is searched
+                metrics.increment("filter_fallback_total")
+            return self.index.search(query_embeddings, top_k)
+        if selector is None:
+            # QuantizedIndex scans the filtered rows directly
+            return self.index.search(query_embeddings, top_k, ids=ids)
+        return self.index.search(query_embeddings, top_k, params=search_parameters(self.index, selector))
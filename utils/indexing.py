@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import numpy as np
+import faiss
+from utils.embedding_store import EmbeddingStore
+
+
+def encode_corpus(texts, embedder, batch_size=64, num_workers=0, sort_by_length=True, log_every=20):
+    """
+    Encode a list of texts in batches, optionally across a pool of worker processes.
+
+    Texts are sorted by length before batching so each batch pads to similar lengths, and the
+    embeddings are returned in the original order. Throughput is reported in chunks/sec.
+
+    Args:
+        texts (list): Texts to encode.
+        embedder (SentenceTransformer): Embedding model.
+        batch_size (int): Number of texts per forward pass.
+        num_workers (int): Number of CPU worker processes. 0 or 1 encodes in this process. Workers are
+            spawned, so the calling script must guard its entry point with `if __name__ == "__main__"`.
+        sort_by_length (bool): Whether to group texts of similar length into the same batch.
+        log_every (int): Report progress every `log_every` batches.
+
+    Returns:
+        np.ndarray: float32 embeddings, one row per text.
+    """
+    total = len(texts)
+    dimension = embedder.get_sentence_embedding_dimension()
+    embeddings = np.empty((total, dimension), dtype=np.float32)
+    if total == 0:
+        return embeddings
+
+    if sort_by_length:
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+    else:
+        order = np.arange(total)
+
+    pool = None
+    if num_workers > 1:
+        pool = embedder.start_multi_process_pool(target_devices=["cpu"] * num_workers)
+        # Hand each worker several batches per round trip to amortise the inter-process copy
+        step = batch_size * num_workers * 4
+    else:
+        step = batch_size
+
+    start_time = time.perf_counter()
+    try:
+        for batch_idx, start in enumerate(range(0, total, step)):
+            rows = order[start:start + step]
+            batch = [texts[row] for row in rows]
+            if pool is not None:
+                batch_embeddings = embedder.encode_multi_process(batch, pool, batch_size=batch_size)
+            else:
+                batch_embeddings = embedder.encode(batch, batch_size=batch_size, convert_to_numpy=True)
+            embeddings[rows] = batch_embeddings
+
+            done = min(start + step, total)
+            if (batch_idx + 1) % log_every == 0 and done < total:
+                elapsed = time.perf_counter() - start_time
+                print(f"Encoded {done}/{total} chunks ({done / elapsed:.1f} chunks/sec)")
+    finally:
+        if pool is not None:
+            embedder.stop_multi_process_pool(pool)
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    print(f"Encoded {total} chunks in {elapsed:.1f}s ({total / elapsed:.1f} chunks/sec)")
+    return embeddings
+
+
+def embed_chunks(chunks, embedder, model_name="all-MiniLM-L6-v2", store_dir=None, batch_size=64, num_workers=0,
+                 compact=False):
+    """
+    Embed the contents of each chunk, reusing cached vectors when an embedding store is given.
+
+    Args:
+        chunks (list): Chunks with a "contents" field.
+        embedder (SentenceTransformer): Embedding model.
+        model_name (str): Name of the embedding model, used to key the store.
+        store_dir (str): Optional embedding store directory. Only new or changed chunks are embedded.
+        batch_size (int): Number of chunks per forward pass.
+        num_workers (int): Number of CPU worker processes used for encoding.
+        compact (bool): Afterwards, drop stored vectors of chunks not in `chunks`, so the store does
+            not keep growing as chunk contents change. Leave off when one store serves several
+            chunkings.
+
+    Returns:
+        np.ndarray: float32 embeddings, one row per chunk.
+    """
+    texts = [chunk["contents"] for chunk in chunks]
+
+    def encode(batch):
+        return encode_corpus(batch, embedder, batch_size=batch_size, num_workers=num_workers)
+
+    if store_dir is None:
+        return np.asarray(encode(texts), dtype=np.float32)
+
+    store = EmbeddingStore(store_dir, model_name)
+    embeddings = store.get_or_compute(texts, encode)
+    if compact:
+        store.compact(texts)
+    return embeddings
+
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+def normalize_embeddings(embeddings):
+    """
+    L2-normalize the rows of an embedding matrix, so inner products are cosine similarities.
+
+    Args:
+        embeddings (np.ndarray): Matrix of shape (n, dimension).
+
+    Returns:
+        np.ndarray: A normalized float32 copy; all-zero rows stay zero.
+    """
+    embeddings = np.array(embeddings, dtype=np.float32, order="C")
+    # One multithreaded pass in FAISS instead of a Python loop over rows
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def default_nlist(num_vectors):
+    """
+    Pick an IVF list count of about 4 * sqrt(n), keeping at least 39 training points per centroid.
+    """
+    return max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+
+
+def build_faiss_index(embeddings, index_type="flat", nlist=None, hnsw_m=32, ef_construction=200, pq_m=48, pq_nbits=8,
+                      normalize=False):
+    """
+    Build an inner-product FAISS index over the embeddings.
+
+    Args:
+        embeddings (np.ndarray): Matrix of shape (n, dimension).
+        index_type (str): One of "flat" (exact brute force), "ivf" (inverted lists over trained
+            centroids), "hnsw" (graph) or "ivfpq" (inverted lists with product-quantized codes).
+        nlist (int): Number of IVF centroids. Defaults to `default_nlist(n)`.
+        hnsw_m (int): Neighbours per HNSW node.
+        ef_construction (int): HNSW build-time beam width.
+        pq_m (int): Number of PQ sub-quantizers; must divide the dimension.
+        pq_nbits (int): Bits per PQ code.
+        normalize (bool): L2-normalize the vectors first, so scores are cosine similarities.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    if normalize:
+        embeddings = normalize_embeddings(embeddings)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    num_vectors, dimension = embeddings.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension) # Inner product index
+    elif index_type in ("ivf", "ivfpq"):
+        nlist = nlist or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            if dimension % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dimension}.")
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}.")
+
+    index.add(embeddings)
+    return index
+
+
+def configure_index(index, nprobe=None, ef_search=None):
+    """
+    Apply search-time knobs to a loaded index. Knobs that do not apply to the index type are ignored.
+
+    Args:
+        index (faiss.Index): The loaded index.
+        nprobe (int): Number of IVF lists visited per query.
+        ef_search (int): HNSW search-time beam width.
+
+    Returns:
+        faiss.Index: The same index, for chaining.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if nprobe is not None and ivf is not None:
+        ivf.nprobe = nprobe
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def manifest_path(index_file):
+    return f"{index_file}.manifest.json"
+
+
+def write_index_manifest(index, index_file, embedding_model, normalized):
+    """
+    Record how an index was built next to it, so loaders can check it matches the embedder.
+
+    Args:
+        index (faiss.Index): The built index.
+        index_file (str): Path the index was written to; the manifest goes to `manifest_path(index_file)`.
+        embedding_model (str): Name of the model that produced the vectors.
+        normalized (bool): Whether the vectors were L2-normalized.
+    """
+    manifest = {
+        "embedding_model": embedding_model,
+        "dimension": index.d,
+        "ntotal": index.ntotal,
+        "metric": "inner_product" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2",
+        "normalized": normalized,
+        "index_type": type(index).__name__
+    }
+    with open(manifest_path(index_file), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+
+def load_index_manifest(index_file):
+    """
+    Returns:
+        dict or None: The manifest written by `write_index_manifest`, or None for older indexes without one.
+    """
+    path = manifest_path(index_file)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def verify_index_manifest(manifest, index, embedding_model, dimension, require_normalized=False):
+    """
+    Check that a loaded index matches its manifest and the embedder that will query it.
+
+    Args:
+        manifest (dict): The index manifest.
+        index (faiss.Index): The loaded index.
+        embedding_model (str): Name of the query embedding model.
+        dimension (int): Output dimension of the query embedding model.
+        require_normalized (bool): Also require normalized vectors, e.g. when scores are thresholded.
+
+    Raises:
+        ValueError: Listing every mismatch.
+    """
+    metric = "inner_product" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+    problems = []
+    if manifest["embedding_model"] != embedding_model:
+        problems.append(f"built with {manifest['embedding_model']} but queried with {embedding_model}")
+    if manifest["dimension"] != dimension or index.d != dimension:
+        problems.append(f"dimension {index.d} (manifest {manifest['dimension']}) but the embedder outputs {dimension}")
+    if manifest["ntotal"] != index.ntotal:
+        problems.append(f"holds {index.ntotal} vectors but the manifest records {manifest['ntotal']}")
+    if manifest["metric"] != metric:
+        problems.append(f"uses the {metric} metric but the manifest records {manifest['metric']}")
+    if require_normalized and not manifest.get("normalized"):
+        problems.append("was built from unnormalized vectors, so its scores cannot be thresholded")
+    if problems:
+        raise ValueError("Index does not match its manifest or embedder: " + "; ".join(problems) + ".")
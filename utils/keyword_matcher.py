@@ -0,0 +1,128 @@
+import re
+
+_TITLE_PREFIX = re.compile(
+    r"^the (?:famous history of the life of |life and death of |tragedy of |comedy of |history of |life of )"
+)
+# "king" is optional: "THE FIRST PART OF HENRY THE SIXTH" has no "king" in it
+_KING_ORDINAL = re.compile(r"\b(?:king )?(\w+) the (first|second|third|fourth|fifth|sixth|seventh|eighth)\b")
+_PART = re.compile(r"^the (?:first|second|third) part of ")
+_ROMAN = {
+    "first": "i", "second": "ii", "third": "iii", "fourth": "iv",
+    "fifth": "v", "sixth": "vi", "seventh": "vii", "eighth": "viii"
+}
+_GENRES = {"sonnet": "Sonnet", "poem": "Poem", "play": "Play"}
+# Everyday words left alone by prefix stripping ("the comedy of errors" -> "errors"); as aliases
+# they would filter unrelated questions ("What errors does Hamlet make?") to one play
+_COMMON_WORDS = frozenset({"errors", "night", "tale", "love", "will", "nothing", "much", "well", "ado"})
+
+
+def normalize_text(text):
+    """
+    Lowercase and fold curly apostrophes so titles and queries compare equal.
+    """
+    return text.lower().replace("’", "'").replace("‘", "'")
+
+
+def title_aliases(title):
+    """
+    Generate the ways a query is likely to refer to a title.
+
+    E.g. "THE TRAGEDY OF HAMLET, PRINCE OF DENMARK" yields "hamlet, prince of denmark" and
+    "hamlet"; "THE FIRST PART OF KING HENRY THE FOURTH" yields "king henry the fourth" and "henry iv".
+    A single common word is never an alias: "THE COMEDY OF ERRORS" yields "comedy of errors" but
+    not "errors".
+
+    Args:
+        title (str): Title as it appears in the chunk metadata.
+
+    Returns:
+        set: Normalized aliases, including the full title.
+    """
+    full = normalize_text(title).strip()
+    aliases = {full}
+
+    short = _PART.sub("", _TITLE_PREFIX.sub("", full))
+    aliases.add(short)
+    # Drop subtitles: "twelfth night; or, what you will", "hamlet, prince of denmark"
+    aliases.add(re.split(r"[;,]", short)[0].strip())
+    for alias in list(aliases):
+        if alias.startswith(("the ", "a ")):
+            aliases.add(alias.split(" ", 1)[1])
+
+    for match in _KING_ORDINAL.finditer(short):
+        aliases.add(f"{match.group(1)} {_ROMAN[match.group(2)]}")
+        aliases.add(f"{match.group(1)} the {match.group(2)}")
+
+    return {alias for alias in aliases if len(alias) > 3 and alias not in _COMMON_WORDS}
+
+
+class KeywordMatcher:
+    """
+    Detect titles, genres and sonnet numbers in a query with one precompiled regex.
+
+    Every alias of every title is folded into a single alternation (longest first, so "henry viii"
+    wins over "henry v"), and sonnet numbers and genres are extra named groups of the same pattern,
+    so a query is scanned once regardless of the number of titles.
+    """
+
+    def __init__(self, titles, extra_aliases=()):
+        """
+        Args:
+            titles (iterable): Canonical titles, e.g. from the chunk metadata or `parsing.parse_contents`.
+                Sonnet titles ("Sonnet 18", "THE SONNETS") are handled by the sonnet and genre groups instead.
+            extra_aliases (iterable): Hand-written short names. Each maps to the titles containing it,
+                or to itself when none does.
+        """
+        titles = sorted({
+            title for title in titles if not re.fullmatch(r"(?:the )?sonnets?(?: \d+)?", normalize_text(title).strip())
+        })
+
+        self.alias_titles = {}
+        for title in titles:
+            for alias in title_aliases(title):
+                self.alias_titles.setdefault(alias, []).append(title)
+
+        for alias in extra_aliases:
+            alias = normalize_text(alias)
+            if alias in _GENRES or alias in self.alias_titles:
+                continue
+            matches = [title for title in titles if alias in normalize_text(title)]
+            self.alias_titles[alias] = matches or [alias]
+
+        alternation = "|".join(re.escape(alias) for alias in sorted(self.alias_titles, key=len, reverse=True))
+        self.pattern = re.compile(
+            r"(?P<sonnet>\bsonnets?\s*(?:no\.?\s*)?(?P<number>\d+)\b)"
+            + (rf"|(?P<title>(?<!\w)(?:{alternation})(?!\w))" if alternation else "")
+            + r"|(?P<genre>\b(?:sonnet|poem|play)s?\b)"
+        )
+
+    def match(self, query):
+        """
+        Extract titles, genres and sonnet numbers from the query.
+
+        Args:
+            query (str): The user query.
+
+        Returns:
+            dict: "names" (canonical titles, with "Sonnet N" for numbered sonnets), "genres" and
+            "sonnets" (sonnet numbers), each in order of first appearance without duplicates.
+        """
+        names = []
+        genres = []
+        sonnets = []
+
+        for match in self.pattern.finditer(normalize_text(query)):
+            if match.group("sonnet"):
+                number = int(match.group("number"))
+                sonnets.append(number)
+                names.append(f"Sonnet {number}")
+            elif match.group("genre"):
+                genres.append(_GENRES[match.group("genre").rstrip("s")])
+            else:
+                names.extend(self.alias_titles[match.group("title")])
+
+        return {
+            "names": list(dict.fromkeys(names)),
+            "genres": list(dict.fromkeys(genres)),
+            "sonnets": list(dict.fromkeys(sonnets))
+        }
@@ -0,0 +1,207 @@
+import json
+import mmap
+import os
+import re
+import numpy as np
+from utils.indexing import encode_corpus, normalize_embeddings
+
+_CHUNK_NUMBER = re.compile(r"_chunk_(\d+)$")
+
+
+def _line_rows(chunk, line_words, step, max_words):
+    # Line range [start, end) of a chunk within its book, from the structured chunker's line
+    # metadata or, for word-window chunks, from the chunk number
+    metadata = chunk.get("metadata", {})
+    if "line_start" in metadata:
+        return metadata["line_start"] - 1, metadata["line_end"]
+    match = _CHUNK_NUMBER.search(chunk["id"])
+    if match is None:
+        # Sonnets and other unsplit works are one chunk
+        return 0, len(line_words)
+    word_start = (int(match.group(1)) - 1) * step
+    word_end = word_start + max_words
+    cumulative = np.cumsum(line_words)
+    start = int(np.searchsorted(cumulative, word_start, side="right"))
+    end = int(np.searchsorted(cumulative, word_end, side="left")) + 1
+    return start, min(end, len(line_words))
+
+
+def build_line_index(books, chunks, embedder, store_dir, max_words=400, overlap=40, batch_size=64, num_workers=0):
+    """
+    Embed every non-blank line of the corpus and record which lines each chunk covers.
+
+    Lines are stored once, in book order, so each chunk maps to a contiguous row range of the
+    line matrix even though neighbouring chunks overlap.
+
+    Layout of `store_dir`:
+        line_embeddings.npy  float16 normalized line embeddings, one row per non-blank line
+        line_books.npy       int32 book index per row
+        line_numbers.npy     int32 1-based line number within the book per row
+        lines.bin            UTF-8 line texts, concatenated; line_offsets.npy holds n + 1 byte offsets
+        chunk_ranges.npy     int64 [start, end) row range per chunk, in chunk (FAISS) order
+        meta.json            chunk IDs and book IDs/names
+
+    Args:
+        books (iterable): Parsed books ({"id", "name", "contents"}), e.g. from `parsing.iter_books`.
+        chunks (list): Chunks in FAISS index order, with IDs as produced in `process.py`.
+        embedder (SentenceTransformer): Embedding model (the one used for the chunk index).
+        store_dir (str): Output directory.
+        max_words (int): Chunk size used by the word-window chunker.
+        overlap (int): Chunk overlap used by the word-window chunker.
+        batch_size (int): Lines per forward pass.
+        num_workers (int): CPU worker processes used for encoding.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    step = max_words - overlap
+
+    book_entries = []
+    line_texts = []
+    line_books = []
+    line_numbers = []
+    # Per book: word count of every line and the row of the first non-blank line at or after it
+    layouts = {}
+
+    for book_idx, book in enumerate(books):
+        book_entries.append({"id": book["id"], "name": book["name"]})
+        lines = book["contents"].split("\n")
+        next_row = np.empty(len(lines) + 1, dtype=np.int64)
+        for line_number, line in enumerate(lines):
+            next_row[line_number] = len(line_texts)
+            if line.strip():
+                line_texts.append(line.strip())
+                line_books.append(book_idx)
+                line_numbers.append(line_number + 1)
+        next_row[len(lines)] = len(line_texts)
+        layouts[book["id"]] = ([len(line.split()) for line in lines], next_row)
+
+    chunk_ranges = np.zeros((len(chunks), 2), dtype=np.int64)
+    for position, chunk in enumerate(chunks):
+        book_id = chunk.get("book_id") or _CHUNK_NUMBER.sub("", chunk["id"])
+        if book_id not in layouts:
+            continue
+        line_words, next_row = layouts[book_id]
+        start, end = _line_rows(chunk, line_words, step, max_words)
+        chunk_ranges[position] = (next_row[start], next_row[end])
+
+    embeddings = normalize_embeddings(
+        encode_corpus(line_texts, embedder, batch_size=batch_size, num_workers=num_workers)
+    )
+
+    np.save(os.path.join(store_dir, "line_embeddings.npy"), embeddings.astype(np.float16))
+    np.save(os.path.join(store_dir, "line_books.npy"), np.array(line_books, dtype=np.int32))
+    np.save(os.path.join(store_dir, "line_numbers.npy"), np.array(line_numbers, dtype=np.int32))
+    np.save(os.path.join(store_dir, "chunk_ranges.npy"), chunk_ranges)
+
+    offsets = [0]
+    with open(os.path.join(store_dir, "lines.bin"), "wb") as file:
+        for text in line_texts:
+            encoded = text.encode("utf-8")
+            file.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    np.save(os.path.join(store_dir, "line_offsets.npy"), np.array(offsets, dtype=np.int64))
+
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({"chunk_ids": [chunk["id"] for chunk in chunks], "books": book_entries}, file, ensure_ascii=False)
+    print(f"Line index with {len(line_texts)} lines over {len(chunks)} chunks saved to {store_dir}")
+
+
+class LineIndex:
+    """
+    Fine, line-level stage of two-level retrieval.
+
+    The chunk index picks a handful of chunks; their row ranges select a small slice of the
+    memory-mapped line matrix, which is scored exactly against the query. The cost is a few
+    hundred dot products on top of the chunk search, whatever the corpus size.
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): Directory written by `build_line_index`.
+        """
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.chunk_ids = meta["chunk_ids"]
+        self.books = meta["books"]
+
+        self.embeddings = np.load(os.path.join(store_dir, "line_embeddings.npy"), mmap_mode="r")
+        self.line_books = np.load(os.path.join(store_dir, "line_books.npy"), mmap_mode="r")
+        self.line_numbers = np.load(os.path.join(store_dir, "line_numbers.npy"), mmap_mode="r")
+        self.chunk_ranges = np.load(os.path.join(store_dir, "chunk_ranges.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_dir, "line_offsets.npy"), mmap_mode="r")
+
+        lines_path = os.path.join(store_dir, "lines.bin")
+        if os.path.getsize(lines_path) == 0:
+            self._blob = b""
+        else:
+            with open(lines_path, "rb") as file:
+                self._blob = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def line(self, row):
+        return self._blob[self.offsets[row]:self.offsets[row + 1]].decode("utf-8")
+
+    def search(self, query_embedding, chunk_positions, top_k=5, span_gap=1):
+        """
+        Score the lines of the given chunks and return the best line spans.
+
+        Adjacent selected lines of the same book (at most `span_gap` rows apart) are merged into
+        one span, so a two-line quotation comes back as a single result.
+
+        Args:
+            query_embedding (np.ndarray): Query vector of shape (dimension,) or (1, dimension).
+            chunk_positions (iterable): Chunk positions from the coarse search, best first; -1 is ignored.
+            top_k (int): Maximum number of spans.
+            span_gap (int): Maximum row distance for merging selected lines into one span.
+
+        Returns:
+            list: Spans as dicts with "chunk_position", "book_id", "book_name", "line_number",
+            "end_line_number", "line" (the span text) and "score" (cosine similarity of its best line).
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        # Rows of all candidate chunks, each row credited to the best-ranked chunk containing it
+        rows = []
+        owners = []
+        for position in chunk_positions:
+            if position < 0:
+                continue
+            start, end = self.chunk_ranges[position]
+            rows.append(np.arange(start, end))
+            owners.append(np.full(end - start, position))
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+        owners = np.concatenate(owners)
+        rows, first = np.unique(rows, return_index=True)
+        owners = owners[first]
+
+        scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+        best = np.argsort(-scores, kind="stable")[:top_k]
+
+        spans = []
+        for i in sorted(best.tolist(), key=lambda i: rows[i]):
+            row = int(rows[i])
+            span = spans[-1] if spans else None
+            if (span and row - span["last_row"] <= span_gap
+                    and self.line_books[row] == self.line_books[span["last_row"]]):
+                span["rows"].append(row)
+                span["last_row"] = row
+                span["score"] = max(span["score"], float(scores[i]))
+            else:
+                spans.append({"rows": [row], "last_row": row, "score": float(scores[i]), "owner": int(owners[i])})
+
+        results = []
+        for span in sorted(spans, key=lambda span: span["score"], reverse=True):
+            first_row, last_row = span["rows"][0], span["last_row"]
+            book = self.books[int(self.line_books[first_row])]
+            results.append({
+                "chunk_position": span["owner"],
+                "book_id": book["id"],
+                "book_name": book["name"],
+                "line_number": int(self.line_numbers[first_row]),
+                "end_line_number": int(self.line_numbers[last_row]),
+                "line": "\n".join(self.line(row) for row in range(first_row, last_row + 1)),
+                "score": span["score"]
+            })
+        return results
@@ -0,0 +1,242 @@
+import re
+from collections import Counter
+import numpy as np
+
+NGRAM = 3
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+_VOCAB_BITS = 21
+_INVALID_GRAM = np.iinfo(np.uint64).max
+
+# Straight/curly double quotes, or single quotes opened after a space and closed before
+# punctuation, so apostrophes inside the quotation ("summer's") are kept.
+_QUOTATION_PATTERNS = [
+    re.compile(r'"([^"]+)"'),
+    re.compile(r"“([^”]+)”"),
+    re.compile(r"(?:^|\s)['‘](.+)['’](?=[\s?.!,;:)]|$)"),
+]
+
+
+def extract_quotation(query):
+    """
+    Extract the quoted phrase from a query, if any.
+
+    Args:
+        query (str): The user query.
+
+    Returns:
+        str or None: The longest quoted phrase.
+    """
+    quotations = []
+    for pattern in _QUOTATION_PATTERNS:
+        quotations.extend(match.group(1).strip() for match in pattern.finditer(query))
+    quotations = [quotation for quotation in quotations if quotation]
+    return max(quotations, key=len) if quotations else None
+
+
+# "Which sonnet contains ...", "Where can you find the line ...", "Who says ...": questions whose
+# answer is where a line comes from, rather than what it means
+_SOURCE_QUESTION = re.compile(
+    r"\b(?:which|what)\s+(?:sonnet|play|poem|work|book)s?\b.*\b(?:contains?|includes?|has|have|features?|says?|from|line)\b"
+    r"|\bwhere\s+(?:can|could|do|does|is|are)\b.*\b(?:find|from|appears?|comes?)\b"
+    r"|\bwho\s+(?:says|said|speaks|spoke)\b",
+    re.IGNORECASE
+)
+
+
+def asks_for_source(query):
+    """
+    Whether a query asks where a quoted line comes from.
+
+    Args:
+        query (str): The user query.
+
+    Returns:
+        bool: True for "which work contains this line" questions. The quotation itself is ignored,
+        so words inside it ("from", "has") do not count.
+    """
+    quotation = extract_quotation(query)
+    if quotation:
+        query = query.replace(quotation, " ")
+    return bool(_SOURCE_QUESTION.search(query))
+
+
+def _tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower().replace("’", "'").replace("‘", "'"))
+
+
+class LineLocator:
+    """
+    Exact-phrase locator over the parsed books, backed by a sorted word-trigram index.
+
+    Every position in the corpus token stream is keyed by the trigram starting there, packed into
+    a uint64 and sorted once at build time. A phrase is located by binary-searching its rarest
+    trigram and verifying the candidates against the token stream, so a lookup costs
+    O(|phrase| log N) plus the number of candidates for that trigram.
+    """
+
+    def __init__(self, books, max_words=400, overlap=40):
+        """
+        Args:
+            books (list): Parsed books ({"id", "name", "contents"}) as produced by `parsing.py`.
+            max_words (int): Chunk size of the word-window chunker, to guess the chunk ID of a match.
+                Structure-aware chunks are matched by line range instead (`ChunkStore.position_for_line`).
+            overlap (int): Chunk overlap of the word-window chunker.
+        """
+        self.step = max_words - overlap
+        self.books = []
+        self.vocabulary = {}
+
+        tokens = []
+        word_positions = []
+        line_numbers = []
+        book_starts = []
+
+        for book in books:
+            contents = book["contents"]
+            book_starts.append(len(tokens))
+            # Character offset of each line, to materialize matched lines lazily
+            line_offsets = [0] + [match.end() for match in re.finditer("\n", contents)]
+
+            word_position = 0
+            for line_number, line in enumerate(contents.split("\n"), start=1):
+                # Word positions follow `str.split()`, as in `chunk_text_by_words`
+                for word in line.split():
+                    for token in _tokenize(word):
+                        tokens.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                        word_positions.append(word_position)
+                        line_numbers.append(line_number)
+                    word_position += 1
+
+            self.books.append({
+                "id": book["id"],
+                "name": book["name"],
+                "contents": contents,
+                "line_offsets": line_offsets,
+                "num_words": word_position
+            })
+
+        if len(self.vocabulary) >= 2 ** _VOCAB_BITS:
+            raise ValueError("Vocabulary too large to pack trigrams into 64 bits.")
+
+        self.tokens = np.array(tokens, dtype=np.int64)
+        self.word_positions = np.array(word_positions, dtype=np.int32)
+        self.line_numbers = np.array(line_numbers, dtype=np.int32)
+        self.book_starts = np.array(book_starts + [len(tokens)], dtype=np.int64)
+
+        grams = self._pack(self.tokens)
+        # Trigrams that straddle two books never match a real phrase
+        book_of_gram = np.searchsorted(self.book_starts, np.arange(len(grams)), side="right") - 1
+        crosses = self.book_starts[book_of_gram + 1] < np.arange(len(grams)) + NGRAM
+        grams[crosses] = _INVALID_GRAM
+
+        order = np.argsort(grams, kind="stable")
+        self.sorted_grams = grams[order]
+        self.sorted_positions = order.astype(np.int64)
+
+    @staticmethod
+    def _pack(token_ids):
+        if len(token_ids) < NGRAM:
+            return np.empty(0, dtype=np.uint64)
+        grams = np.zeros(len(token_ids) - NGRAM + 1, dtype=np.uint64)
+        for offset in range(NGRAM):
+            part = token_ids[offset:len(token_ids) - NGRAM + 1 + offset].astype(np.uint64)
+            grams = (grams << np.uint64(_VOCAB_BITS)) | part
+        return grams
+
+    def _postings(self, gram):
+        start = np.searchsorted(self.sorted_grams, gram, side="left")
+        end = np.searchsorted(self.sorted_grams, gram, side="right")
+        return self.sorted_positions[start:end]
+
+    def locate(self, phrase, max_results=5, min_match=0.6):
+        """
+        Find where a phrase occurs in the corpus.
+
+        Exact matches are returned when there are any. Otherwise, the trigrams of the phrase vote
+        for aligned start positions, which tolerates small wording or spelling differences.
+
+        Args:
+            phrase (str): The phrase to locate.
+            max_results (int): Maximum number of matches.
+            min_match (float): Minimum fraction of phrase trigrams a fuzzy match must share.
+
+        Returns:
+            list: Matches with book, chunk ID, line number, line text and a match score in [0, 1].
+        """
+        phrase_tokens = _tokenize(phrase)
+        if len(phrase_tokens) < NGRAM:
+            return []
+        ids = np.array([self.vocabulary.get(token, -1) for token in phrase_tokens], dtype=np.int64)
+        known = ids >= 0
+        grams = self._pack(np.where(known, ids, 0))
+        # A trigram containing an unknown word cannot match anything
+        gram_valid = np.array([known[i:i + NGRAM].all() for i in range(len(grams))])
+
+        starts = []
+        if gram_valid.all():
+            # Exact path: binary-search every trigram and verify only the rarest one's candidates
+            counts = [
+                np.searchsorted(self.sorted_grams, gram, side="right") - np.searchsorted(self.sorted_grams, gram)
+                for gram in grams
+            ]
+            rarest = int(np.argmin(counts))
+            for position in self._postings(grams[rarest]) - rarest:
+                end = position + len(ids)
+                if position >= 0 and end <= len(self.tokens) and np.array_equal(self.tokens[position:end], ids):
+                    starts.append((int(position), 1.0))
+                    if len(starts) == max_results:
+                        break
+
+        if not starts:
+            votes = Counter()
+            for offset, gram in enumerate(grams):
+                if gram_valid[offset]:
+                    votes.update((self._postings(gram) - offset).tolist())
+            needed = min_match * len(grams)
+            starts = [
+                (position, count / len(grams))
+                for position, count in votes.most_common(max_results)
+                if count >= needed and position >= 0
+            ]
+
+        return [self._describe(position, len(ids), score) for position, score in starts]
+
+    def _describe(self, position, length, score):
+        book_idx = int(np.searchsorted(self.book_starts, position, side="right") - 1)
+        book = self.books[book_idx]
+        word_position = int(self.word_positions[position])
+        line_number = int(self.line_numbers[position])
+
+        if "sonnet" in book["id"]:
+            chunk_id = book["id"]
+        else:
+            last_chunk = max(0, (book["num_words"] - 1) // self.step)
+            chunk_id = f"{book['id']}_chunk_{min(word_position // self.step, last_chunk) + 1}"
+
+        line_offsets = book["line_offsets"]
+        line_start = line_offsets[line_number - 1]
+        line_end = line_offsets[line_number] - 1 if line_number < len(line_offsets) else len(book["contents"])
+
+        return {
+            "book_id": book["id"],
+            "book_name": book["name"],
+            "chunk_id": chunk_id,
+            "line_number": line_number,
+            "end_line_number": int(self.line_numbers[min(position + length, len(self.tokens)) - 1]),
+            "line": book["contents"][line_start:line_end].strip(),
+            "score": score
+        }
+
+
+def describe_line_match(result):
+    """
+    Phrase a located line as an answer, so no generator call is needed. Only meant for exact
+    matches to questions for which `asks_for_source` holds.
+
+    Args:
+        result (dict): A result returned by `utils.retrieve.locate_quotation`.
+
+    Returns:
+        str: The answer text.
+    """
+    return f"The line \"{result['line']}\" is from {result['title']} (line {result['line_number']})."
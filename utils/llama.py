@@ -1,39 +1,145 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-import torch
+import threading
+from utils.context import pack_context
+from utils.resources import registry
+from utils import metrics
 
-tokenizer = AutoTokenizer.from_pretrained("meta-llama/Llama-3.2-1B")
-model = AutoModelForCausalLM.from_pretrained("meta-llama/Llama-3.2-1B")
+LLAMA_MODEL = "meta-llama/Llama-3.2-1B"
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model = model.to(device)
-
-generator_pipeline = pipeline(
-    "text-generation", 
-    model=model, 
-    tokenizer=tokenizer, 
-    device=device, 
-    pad_token_id=tokenizer.eos_token_id
+# Shared by every prompt, so the local server computes its KV cache once (see utils.llama_server)
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers literary questions about William Shakespeare's work."
+    "Use only the passages provided to answer the question. Do not repeat the input passages and the questions. Do not make up facts. Answer accurately and concisely.\n\n"
 )
 
-def generate_answer(query, retrieved_passages):
+# Maximum tokens of passage text packed into the prompt
+CONTEXT_TOKEN_BUDGET = 768
+
+def _load_tokenizer(model_name=LLAMA_MODEL):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_name)
+
+registry.register("llama_tokenizer", _load_tokenizer)
+
+def count_tokens(text):
     """
-    Generate an answer using Llama models.
+    Count tokens with the Llama tokenizer (loaded on first use, without the model).
+    """
+    return len(registry.get("llama_tokenizer")(text, add_special_tokens=False).input_ids)
+
+def _load_model(model_name=LLAMA_MODEL, quantize=False, device=None):
+    # Imported here so importing this module does not pull in transformers and torch
+    from transformers import AutoModelForCausalLM
+    import torch
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+
+    if quantize:
+        if device != "cpu":
+            raise ValueError("Dynamic int8 quantization is only supported on CPU.")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model.to(device)
+
+registry.register("llama_model", _load_model)
+
+def get_model(**kwargs):
+    """
+    Return the shared Llama model, loading it on first use. The generation pipeline and the batched
+    server (`utils.llama_server.LlamaEngine`) both run on it, so a process holds one copy.
+
+    Args:
+        **kwargs: Used on first load only: model_name, quantize (dynamic int8, CPU only) and device.
     """
-    system_prompt = (
-        "You are a helpful assistant that answers literary questions about William Shakespeare's work."
-        "Use only the passages provided to answer the question. Do not repeat the input passages and the questions. Do not make up facts. Answer accurately and concisely.\n\n"
+    return registry.get("llama_model", **kwargs)
+
+def _load_generator_pipeline(model_name=LLAMA_MODEL):
+    from transformers import pipeline
+
+    tokenizer = registry.get("llama_tokenizer", model_name=model_name)
+    model = get_model(model_name=model_name)
+
+    return pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        device=model.device,
+        pad_token_id=tokenizer.eos_token_id
     )
 
+registry.register("llama", _load_generator_pipeline)
+
+def get_generator_pipeline():
+    """
+    Return the shared Llama text-generation pipeline, loading it on first use.
+    """
+    return registry.get("llama")
+
+def build_prompt(query, retrieved_passages):
+    """
+    Build the prompt sent to the Llama model, with the passages packed into `CONTEXT_TOKEN_BUDGET` tokens.
+    """
     question_part = f"User Question: {query}\n\n"
 
     passages_part = "Relevant Passages:\n"
-    for idx, passage_text in enumerate(retrieved_passages):
+    packed = pack_context(query, retrieved_passages, count_tokens=count_tokens, token_budget=CONTEXT_TOKEN_BUDGET)
+    for idx, passage_text in enumerate(packed):
         passages_part += f"[Passage #{idx+1}]: {passage_text}\n"
 
     answer_prompt = "\nAnswer concisely and accurately:\n"
-    combined_prompt = system_prompt + question_part + passages_part + answer_prompt
-    outputs = generator_pipeline(combined_prompt, max_new_tokens=500, do_sample=True)
+    return SYSTEM_PROMPT + question_part + passages_part + answer_prompt
+
+@metrics.traced("generate_answer_llama")
+def generate_answer(query, retrieved_passages):
+    """
+    Generate an answer using Llama models.
+    """
+    combined_prompt = build_prompt(query, retrieved_passages)
+    outputs = get_generator_pipeline()(combined_prompt, max_new_tokens=500, do_sample=True)
     output = outputs[0]["generated_text"]
     answer = output.replace(combined_prompt, "").strip()
 
-    return answer
\ No newline at end of file
+    return answer
+
+def stream_answer(query, retrieved_passages, max_new_tokens=500):
+    """
+    Stream an answer from the Llama model as tokens are generated.
+
+    Generation runs on a background thread and decoded text is handed over through a
+    `TextIteratorStreamer`, so the first words can be shown long before generation finishes.
+
+    Args:
+        query (str): The user query.
+        retrieved_passages (list): Retrieved passages.
+        max_new_tokens (int): Maximum number of tokens to generate.
+
+    Yields:
+        str: Pieces of the answer text, in order.
+    """
+    from transformers import TextIteratorStreamer
+
+    generator = get_generator_pipeline()
+    tokenizer = generator.tokenizer
+    model = generator.model
+
+    inputs = tokenizer(build_prompt(query, retrieved_passages), return_tensors="pt").to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    thread = threading.Thread(
+        target=model.generate,
+        kwargs=dict(
+            **inputs,
+            streamer=streamer,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            pad_token_id=tokenizer.eos_token_id
+        ),
+        daemon=True
+    )
+    thread.start()
+
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
@@ -0,0 +1,231 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from utils.llama import LLAMA_MODEL, SYSTEM_PROMPT, build_prompt, get_model
+from utils.resources import registry
+from utils import metrics
+
+# Greedy decoding is deterministic, so answers from the server can be cached under this version
+MODEL_VERSION = f"{LLAMA_MODEL}/greedy"
+
+
+class LlamaEngine:
+    """
+    Batched greedy generation with a cached system-prompt prefix.
+
+    The KV cache of `SYSTEM_PROMPT` is computed once at load time and expanded to the batch size
+    for every batch, so only the question and passages are run through the model per request.
+    Prompts in a batch are left-padded between the shared prefix and their own tokens; the
+    attention mask hides the padding and explicit position IDs keep every prompt contiguous.
+    """
+
+    def __init__(self, model_name=LLAMA_MODEL, num_threads=None, quantize=False, device=None):
+        """
+        Args:
+            model_name (str): Hugging Face model name.
+            num_threads (int): torch intra-op threads for CPU inference; None keeps the torch default.
+            quantize (bool): Apply dynamic int8 quantization to the Linear layers (CPU only).
+            device (str): "cuda" or "cpu"; defaults to CUDA when available.
+
+        The model is the registry's shared one (`utils.llama.get_model`), also used by the streaming
+        pipeline; `quantize` and `device` only apply if this engine is the first to load it.
+        """
+        # Imported here so importing this module does not pull in transformers and torch
+        import torch
+
+        self.torch = torch
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.tokenizer = registry.get("llama_tokenizer", model_name=model_name)
+        self.model = get_model(model_name=model_name, quantize=quantize, device=device)
+        self.device = self.model.device
+
+        self.eos_token_id = self.tokenizer.eos_token_id
+        self.pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.eos_token_id
+
+        with torch.inference_mode():
+            prefix = self.tokenizer(SYSTEM_PROMPT, return_tensors="pt").input_ids.to(self.device)
+            outputs = self.model(input_ids=prefix, use_cache=True)
+        self.prefix_length = prefix.shape[1]
+        self.prefix_cache = self._to_legacy(outputs.past_key_values)
+
+    @staticmethod
+    def _to_legacy(past_key_values):
+        # Newer transformers return a Cache object; keep plain (key, value) tuples per layer
+        if hasattr(past_key_values, "to_legacy_cache"):
+            return past_key_values.to_legacy_cache()
+        return tuple(past_key_values)
+
+    def _batch_cache(self, batch_size):
+        past = tuple(
+            (key.expand(batch_size, -1, -1, -1).contiguous(), value.expand(batch_size, -1, -1, -1).contiguous())
+            for key, value in self.prefix_cache
+        )
+        try:
+            from transformers import DynamicCache
+        except ImportError:
+            return past
+        return DynamicCache.from_legacy_cache(past)
+
+    def generate(self, prompts, max_new_tokens=200):
+        """
+        Greedily generate continuations for a batch of prompts.
+
+        Args:
+            prompts (list): Full prompts, each starting with `SYSTEM_PROMPT`.
+            max_new_tokens (int or list): Token limit, for the whole batch or per prompt.
+
+        Returns:
+            list: Generated text per prompt, without the prompt.
+        """
+        torch = self.torch
+        if isinstance(max_new_tokens, int):
+            max_new_tokens = [max_new_tokens] * len(prompts)
+
+        suffixes = []
+        for prompt in prompts:
+            if not prompt.startswith(SYSTEM_PROMPT):
+                raise ValueError("Prompts must start with SYSTEM_PROMPT to reuse its cached prefix.")
+            suffixes.append(self.tokenizer(prompt[len(SYSTEM_PROMPT):], add_special_tokens=False).input_ids)
+
+        batch_size = len(suffixes)
+        suffix_length = max(len(ids) for ids in suffixes)
+        input_ids = torch.full((batch_size, suffix_length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, self.prefix_length + suffix_length), dtype=torch.long)
+        attention_mask[:, :self.prefix_length] = 1
+        for row, ids in enumerate(suffixes):
+            input_ids[row, suffix_length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, self.prefix_length + suffix_length - len(ids):] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, self.prefix_length:]
+
+        limits = torch.tensor(max_new_tokens, device=self.device)
+        generated = []
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=self.device)
+        past = self._batch_cache(batch_size)
+
+        with torch.inference_mode():
+            for step in range(max(max_new_tokens)):
+                outputs = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past,
+                    use_cache=True
+                )
+                past = outputs.past_key_values
+                next_tokens = outputs.logits[:, -1, :].argmax(dim=-1)
+                next_tokens = torch.where(finished, torch.full_like(next_tokens, self.pad_token_id), next_tokens)
+                generated.append(next_tokens)
+
+                finished |= (next_tokens == self.eos_token_id) | (limits <= step + 1)
+                if finished.all():
+                    break
+
+                input_ids = next_tokens.unsqueeze(-1)
+                position_ids = position_ids[:, -1:] + 1
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((batch_size, 1))], dim=-1)
+
+        tokens = torch.stack(generated, dim=1).tolist() if generated else [[] for _ in prompts]
+        answers = []
+        for row, limit in zip(tokens, max_new_tokens):
+            row = row[:limit]
+            if self.eos_token_id in row:
+                row = row[:row.index(self.eos_token_id)]
+            answers.append(self.tokenizer.decode(row, skip_special_tokens=True).strip())
+        return answers
+
+
+class LlamaServer:
+    """
+    In-process request queue in front of a `LlamaEngine`.
+
+    Callers submit prompts from any thread; one worker thread drains the queue into batches of up
+    to `max_batch_size`, waiting at most `max_wait` seconds for a batch to fill, and resolves each
+    caller's future when its batch finishes.
+    """
+
+    def __init__(self, engine, max_batch_size=8, max_wait=0.01):
+        """
+        Args:
+            engine (LlamaEngine): The generation engine.
+            max_batch_size (int): Maximum prompts generated together.
+            max_wait (float): Seconds to wait for more prompts after the first one arrives.
+        """
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="llama-server", daemon=True)
+        self._worker.start()
+
+    def submit(self, query, retrieved_passages, max_new_tokens=200):
+        """
+        Queue a question for generation.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the answer text.
+        """
+        future = Future()
+        self._queue.put((build_prompt(query, retrieved_passages), max_new_tokens, future))
+        return future
+
+    @metrics.traced("generate_answer_llama_server")
+    def generate(self, query, retrieved_passages, max_new_tokens=200, timeout=None):
+        """
+        Generate an answer, blocking until its batch is done.
+        """
+        return self.submit(query, retrieved_passages, max_new_tokens).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            prompts, limits, futures = zip(*batch)
+            try:
+                answers = self.engine.generate(list(prompts), list(limits))
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            for future, answer in zip(futures, answers):
+                future.set_result(answer)
+
+
+def _load_llama_server(model_name=LLAMA_MODEL, num_threads=None, quantize=False, max_batch_size=8, max_wait=0.01):
+    engine = LlamaEngine(model_name=model_name, num_threads=num_threads, quantize=quantize)
+    return LlamaServer(engine, max_batch_size=max_batch_size, max_wait=max_wait)
+
+registry.register("llama_server", _load_llama_server)
+
+def get_llama_server(**kwargs):
+    """
+    Return the shared local Llama server, starting it on first use.
+
+    Args:
+        **kwargs: Used on first load only: model_name, num_threads, quantize, max_batch_size, max_wait.
+
+    Returns:
+        LlamaServer: The server.
+    """
+    return registry.get("llama_server", **kwargs)
@@ -0,0 +1,267 @@
+import bisect
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_enabled = False
+_jsonl_path = None
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram in the Prometheus layout.
+    """
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Trace:
+    """
+    Spans recorded for one request, in the order they finished.
+    """
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.start = time.time()
+        self.spans = []
+
+    def add(self, name, duration_ms, depth):
+        self.spans.append({"name": name, "ms": duration_ms, "depth": depth})
+
+    def to_dict(self):
+        return {"request_id": self.request_id, "start": self.start, "spans": self.spans}
+
+
+def enable(jsonl_path=None):
+    """
+    Turn instrumentation on.
+
+    Args:
+        jsonl_path (str): Optional file that every finished request's trace is appended to, one JSON object per line.
+    """
+    global _enabled, _jsonl_path
+    _jsonl_path = jsonl_path
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """
+    Clear all counters and histograms.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def increment(name, value=1):
+    """
+    Add to a counter. A no-op while instrumentation is disabled.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def observe(name, value_ms):
+    """
+    Record a latency in a histogram. A no-op while instrumentation is disabled.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(value_ms)
+
+@contextmanager
+def _span(name):
+    trace = _current_trace.get()
+    depth = getattr(trace, "_depth", 0) if trace is not None else 0
+    if trace is not None:
+        trace._depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        observe(name, duration_ms)
+        if trace is not None:
+            trace._depth = depth
+            trace.add(name, duration_ms, depth)
+
+def span(name):
+    """
+    Time a block as a named span of the current request.
+
+    While instrumentation is disabled this returns a shared no-op context manager.
+
+    Args:
+        name (str): Span name, also the histogram name.
+    """
+    if not _enabled:
+        return _NOOP
+    return _span(name)
+
+def traced(name):
+    """
+    Decorator timing every call of a function as a span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def request(request_id=None):
+    """
+    Scope spans to one request.
+
+    Args:
+        request_id (str): Optional ID; a random one is generated otherwise.
+
+    Yields:
+        Trace or None: The request's trace, or None while instrumentation is disabled.
+    """
+    if not _enabled:
+        yield None
+        return
+
+    trace = Trace(request_id)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        observe("request", (time.perf_counter() - start) * 1000)
+        increment("requests_total")
+        if _jsonl_path:
+            with _lock, open(_jsonl_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(trace.to_dict()) + "\n")
+
+def snapshot():
+    """
+    Returns:
+        dict: Current counters and histogram summaries (count, sum and mean in ms).
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {
+                name: {"count": histogram.count, "sum_ms": histogram.sum,
+                       "mean_ms": histogram.sum / histogram.count if histogram.count else 0.0}
+                for name, histogram in _histograms.items()
+            }
+        }
+
+def prometheus_text(prefix="shakespeare_rag"):
+    """
+    Render counters and histograms in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name} {value}")
+        for name, histogram in sorted(_histograms.items()):
+            metric = f"{prefix}_{name}_ms"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        data = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port=9100, host="127.0.0.1"):
+    """
+    Serve GET /metrics on a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def enable_from_env(environ=None):
+    """
+    Turn instrumentation and its exporters on as configured by environment variables. Meant to be
+    called once per process, since instrumentation is process-wide.
+
+    METRICS=1 turns instrumentation on. METRICS_JSONL appends every request's trace to a file and
+    METRICS_PORT serves GET /metrics for Prometheus (on METRICS_HOST, default 127.0.0.1); setting
+    either also turns instrumentation on.
+
+    Args:
+        environ (dict): Variables to read; defaults to `os.environ`.
+
+    Returns:
+        bool: Whether instrumentation is enabled.
+    """
+    environ = os.environ if environ is None else environ
+    jsonl_path = environ.get("METRICS_JSONL") or None
+    port = environ.get("METRICS_PORT")
+    if not (environ.get("METRICS", "") not in ("", "0") or jsonl_path or port):
+        return False
+
+    enable(jsonl_path=jsonl_path)
+    if port:
+        host = environ.get("METRICS_HOST", "127.0.0.1")
+        serve_prometheus(port=int(port), host=host)
+        print(f"Metrics served on http://{host}:{port}/metrics")
+    return True
@@ -1,11 +1,53 @@
 import openai
+from utils.context import approximate_token_count, pack_context
+from utils.resources import registry
+from utils import metrics
 
 # Set your OpenAI API key
-client = openai.OpenAI(api_key="")
+registry.register("openai_client", lambda: openai.OpenAI(api_key=""))
 
-def generate_answer_with_gpt(query, retrieved_passages):
+def get_client():
     """
-    Generate an answer using OpenAI GPT models.
+    Return the shared OpenAI client, creating it on first use.
+    """
+    return registry.get("openai_client")
+
+GPT_MODEL = "gpt-4o-mini"
+# Bump whenever the prompt below changes so cached answers are not reused
+PROMPT_VERSION = 2
+MODEL_VERSION = f"{GPT_MODEL}/prompt-v{PROMPT_VERSION}"
+# Maximum tokens of passage text packed into the prompt
+CONTEXT_TOKEN_BUDGET = 768
+
+def _load_tokenizer(model_name=GPT_MODEL):
+    # tiktoken is optional; without it token counts are approximated
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.encoding_for_model(model_name)
+
+registry.register("gpt_tokenizer", _load_tokenizer)
+
+def count_tokens(text):
+    """
+    Count tokens with the GPT model's tokenizer, or approximately when tiktoken is not installed.
+    """
+    encoding = registry.get("gpt_tokenizer")
+    if encoding is None:
+        return approximate_token_count(text)
+    return len(encoding.encode(text))
+
+def build_messages(query, retrieved_passages):
+    """
+    Build the chat messages sent to the GPT model.
+
+    Args:
+        query (str): The user query.
+        retrieved_passages (list): Retrieved passages, packed into `CONTEXT_TOKEN_BUDGET` tokens.
+
+    Returns:
+        list: Chat messages (system and user).
     """
     system_prompt = (
         "You are a helpful assistant that answers literary questions accurately and concisely. "
@@ -15,22 +57,53 @@ def generate_answer_with_gpt(query, retrieved_passages):
     question_part = f"User Question: {query}\n\n"
     passages_part = "Relevant Passages:\n"
 
-    for idx, passage_text in enumerate(retrieved_passages):
+    packed = pack_context(query, retrieved_passages, count_tokens=count_tokens, token_budget=CONTEXT_TOKEN_BUDGET)
+    for idx, passage_text in enumerate(packed):
         passages_part += f"[Passage #{idx+1}]: {passage_text}\n"
 
     answer_prompt = "\nAnswer concisely and accurately:\n"
     combined_prompt = system_prompt + question_part + passages_part + answer_prompt
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": combined_prompt}
-        ],
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": combined_prompt}
+    ]
+
+@metrics.traced("generate_answer_with_gpt")
+def generate_answer_with_gpt(query, retrieved_passages):
+    """
+    Generate an answer using OpenAI GPT models.
+    """
+    response = get_client().chat.completions.create(
+        model=GPT_MODEL,
+        messages=build_messages(query, retrieved_passages),
         max_tokens=100,
         temperature=0.5
     )
 
     answer = response.choices[0].message.content
 
-    return answer
\ No newline at end of file
+    return answer
+
+def stream_answer_with_gpt(query, retrieved_passages):
+    """
+    Stream an answer from OpenAI GPT models as it is generated.
+
+    Args:
+        query (str): The user query.
+        retrieved_passages (list): Retrieved passages.
+
+    Yields:
+        str: Pieces of the answer text, in order.
+    """
+    stream = get_client().chat.completions.create(
+        model=GPT_MODEL,
+        messages=build_messages(query, retrieved_passages),
+        max_tokens=100,
+        temperature=0.5,
+        stream=True
+    )
+
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
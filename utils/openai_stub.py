@@ -0,0 +1,111 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for POST /v1/chat/completions, for exercising the generation clients
+    without the real API. Latency and injected failures are set on the server.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+            roll = random.random()
+            if roll < server.rate_limit_rate:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                           headers={"Retry-After": str(server.retry_after)})
+                return
+            if roll < server.rate_limit_rate + server.error_rate:
+                self._send(500, {"error": {"message": "Internal error", "type": "server_error"}})
+                return
+
+            question = body.get("messages", [{}])[-1].get("content", "")
+            self._send(200, {
+                "id": f"chatcmpl-stub-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"Stub answer ({len(question)} prompt chars)."},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8008, latency=0.2, rate_limit_rate=0.0, error_rate=0.0, retry_after=0.1):
+    """
+    Create (but do not start) a stub chat completions server.
+
+    Args:
+        host (str): Bind address.
+        port (int): Port; 0 picks a free one (see `server.server_address`).
+        latency (float): Seconds each request takes.
+        rate_limit_rate (float): Fraction of requests answered with 429.
+        error_rate (float): Fraction of requests answered with 500.
+        retry_after (float): Retry-After header sent with 429 responses.
+
+    Returns:
+        ThreadingHTTPServer: The server, with `requests` and `max_in_flight` counters.
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.rate_limit_rate = rate_limit_rate
+    server.error_rate = error_rate
+    server.retry_after = retry_after
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.rate_limit_rate, args.error_rate)
+    print(f"Stub server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,140 @@
+import json
+import os
+import numpy as np
+
+CODE_TYPES = ("int8", "float16", "binary")
+# Number of set bits in every byte value, for Hamming distances over packed binary codes
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def build_quantized_store(embeddings, store_dir, code_types=CODE_TYPES):
+    """
+    Write compact codes of the corpus embeddings next to a full-precision copy for rescoring.
+
+    Layout of `store_dir`:
+        full.npy      float32 embeddings, memory-mapped at search time and read only for candidates
+        int8.npy      int8 codes, symmetric per-dimension scale (int8_scale.npy)
+        float16.npy   float16 embeddings
+        binary.npy    sign bits packed 8 per byte
+        meta.json     vector count, dimension and the code types written
+
+    Args:
+        embeddings (np.ndarray): Matrix of shape (n, dimension), in FAISS index order.
+        store_dir (str): Output directory.
+        code_types (iterable): Any of `CODE_TYPES`.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    np.save(os.path.join(store_dir, "full.npy"), embeddings)
+
+    for code_type in code_types:
+        if code_type == "int8":
+            scale = np.maximum(np.abs(embeddings).max(axis=0), 1e-12) / 127.0
+            codes = np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8)
+            np.save(os.path.join(store_dir, "int8_scale.npy"), scale.astype(np.float32))
+        elif code_type == "float16":
+            codes = embeddings.astype(np.float16)
+        elif code_type == "binary":
+            codes = np.packbits(embeddings > 0, axis=1)
+        else:
+            raise ValueError(f"Unknown code type '{code_type}', expected one of {CODE_TYPES}.")
+        np.save(os.path.join(store_dir, f"{code_type}.npy"), codes)
+
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({"ntotal": len(embeddings), "dimension": embeddings.shape[1], "code_types": list(code_types)}, file)
+
+
+class QuantizedIndex:
+    """
+    Inner-product search over compact codes with exact rescoring.
+
+    Phase one scans the int8, float16 or binary codes (block by block, so no full float32 copy of
+    the corpus is ever made) and keeps `rescore_k` candidates per query. Phase two reads only those
+    rows from the memory-mapped float32 file and ranks them by their exact inner product, so the
+    returned scores match the flat FAISS index.
+    """
+
+    # faiss.METRIC_INNER_PRODUCT, so the index can be checked against the FAISS index's manifest
+    metric_type = 0
+
+    def __init__(self, store_dir, code_type="int8", rescore_k=100, block_size=16384):
+        """
+        Args:
+            store_dir (str): Directory written by `build_quantized_store`.
+            code_type (str): Codes scanned in phase one, one of `CODE_TYPES`.
+            rescore_k (int): Candidates per query rescored in full precision.
+            block_size (int): Rows decoded at a time during the scan.
+        """
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if code_type not in meta["code_types"]:
+            raise ValueError(f"{store_dir} has no {code_type} codes; it holds {meta['code_types']}.")
+
+        self.ntotal = meta["ntotal"]
+        self.d = meta["dimension"]
+        self.code_type = code_type
+        self.rescore_k = rescore_k
+        self.block_size = block_size
+        # Codes are small enough to keep resident; the float32 copy stays on disk
+        self.codes = np.load(os.path.join(store_dir, f"{code_type}.npy"))
+        self.scale = np.load(os.path.join(store_dir, "int8_scale.npy")) if code_type == "int8" else None
+        self.full = np.load(os.path.join(store_dir, "full.npy"), mmap_mode="r")
+
+    def memory_bytes(self):
+        """
+        Returns:
+            dict: Resident bytes of the codes and the bytes a float32 copy would take.
+        """
+        return {"codes": int(self.codes.nbytes), "float32": int(self.ntotal * self.d * 4)}
+
+    def _approximate_scores(self, queries, rows):
+        # Higher is better for every code type; binary uses negated Hamming distance
+        if self.code_type == "binary":
+            query_bits = np.packbits(queries > 0, axis=1)
+            scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+            for start in range(0, len(rows), self.block_size):
+                block = self.codes[rows[start:start + self.block_size]]
+                hamming = _POPCOUNT[np.bitwise_xor(query_bits[:, None, :], block[None, :, :])].sum(axis=2)
+                # The popcount sum is unsigned; negating it unconverted would wrap around
+                scores[:, start:start + len(block)] = -hamming.astype(np.float32)
+            return scores
+
+        if self.code_type == "int8":
+            # Fold the per-dimension scale into the query instead of decoding the codes
+            queries = queries * self.scale
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block = self.codes[rows[start:start + self.block_size]].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def search(self, query_embeddings, top_k, ids=None):
+        """
+        Args:
+            query_embeddings (np.ndarray): Query matrix of shape (n, dimension).
+            top_k (int): Number of results per query.
+            ids (np.ndarray): Optional sorted positions to restrict the search to.
+
+        Returns:
+            tuple: (scores, indices) of shape (n, top_k), like `faiss.Index.search`. Missing
+            results are marked with -1.
+        """
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        rows = np.arange(self.ntotal) if ids is None else np.asarray(ids, dtype=np.int64)
+
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+        if len(rows) == 0:
+            return scores, indices
+
+        approximate = self._approximate_scores(queries, rows)
+        keep = min(max(self.rescore_k, top_k), len(rows))
+        candidates = np.argpartition(-approximate, keep - 1, axis=1)[:, :keep]
+
+        for i, query in enumerate(queries):
+            candidate_rows = np.sort(rows[candidates[i]])
+            exact = np.asarray(self.full[candidate_rows], dtype=np.float32) @ query
+            order = np.argsort(-exact, kind="stable")[:top_k]
+            scores[i, :len(order)] = exact[order]
+            indices[i, :len(order)] = candidate_rows[order]
+        return scores, indices
@@ -0,0 +1,133 @@
+import numpy as np
+from utils.cache import LRUCache, normalize_query
+from utils.resources import registry
+from utils import metrics
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """
+    Re-rank a candidate pool with a cross-encoder, scoring (query, passage) pairs jointly.
+
+    Scores are cached per (normalized query, chunk ID), and every uncached pair of a call (or of a
+    whole batch of queries) goes through a single batched `predict`. With `early_exit_score` set,
+    candidates are scored block by block in first-stage order and scoring stops once `top_k` of
+    them reach the threshold, so confident queries skip most of the pool.
+    """
+
+    def __init__(self, model, cache_size=4096, batch_size=64, early_exit_score=None, block_size=16):
+        """
+        Args:
+            model: A `sentence_transformers.CrossEncoder` (anything with `predict(pairs, batch_size)`).
+            cache_size (int): Maximum number of cached (query, chunk ID) scores.
+            batch_size (int): Forward-pass batch size.
+            early_exit_score (float): Stop scoring once `top_k` candidates score at least this; None scores the whole pool.
+            block_size (int): Candidates scored per step when early exit is enabled.
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.early_exit_score = early_exit_score
+        self.block_size = block_size
+        self.cache = LRUCache(max_size=cache_size)
+
+    def _scores(self, pairs):
+        # pairs: (query, chunk ID, contents); returns one score per pair, computing only cache misses
+        keys = [(normalize_query(query), chunk_id) for query, chunk_id, _ in pairs]
+        scores = [self.cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = self.model.predict(
+                [(pairs[i][0], pairs[i][2]) for i in missing], batch_size=self.batch_size, show_progress_bar=False
+            )
+            for i, score in zip(missing, np.asarray(predicted, dtype=np.float32).tolist()):
+                scores[i] = score
+                self.cache.put(keys[i], score)
+        return scores
+
+    def _ranked(self, candidates, scores, top_k):
+        scored = sorted(zip(candidates, scores), key=lambda item: item[1], reverse=True)
+        results = []
+        for rank, (candidate, score) in enumerate(scored[:top_k], start=1):
+            result = dict(candidate)
+            result["first_stage_rank"] = candidate["rank"]
+            result["rank"] = rank
+            result["rerank_score"] = score
+            results.append(result)
+        return results
+
+    @metrics.traced("rerank")
+    def rerank(self, query, candidates, top_k=5):
+        """
+        Re-rank one query's candidates.
+
+        Args:
+            query (str): The user query.
+            candidates (list): First-stage results with "id", "rank" and "contents", best first.
+            top_k (int): Number of results to keep.
+
+        Returns:
+            list: The best `top_k` candidates by cross-encoder score, with "rerank_score" and
+            "first_stage_rank" added. With early exit, unscored candidates are dropped.
+        """
+        if self.early_exit_score is None:
+            return self.rerank_batch([query], [candidates], top_k=top_k)[0]
+
+        scored = []
+        scores = []
+        for start in range(0, len(candidates), self.block_size):
+            block = candidates[start:start + self.block_size]
+            scored.extend(block)
+            scores.extend(self._scores([(query, candidate["id"], candidate["contents"]) for candidate in block]))
+            if sum(score >= self.early_exit_score for score in scores) >= top_k:
+                break
+        return self._ranked(scored, scores, top_k)
+
+    @metrics.traced("rerank_batch")
+    def rerank_batch(self, queries, candidate_lists, top_k=5):
+        """
+        Re-rank many queries' candidates with one batched forward pass over all uncached pairs.
+
+        Args:
+            queries (list): Query strings.
+            candidate_lists (list): First-stage results per query, best first.
+            top_k (int): Number of results to keep per query.
+
+        Returns:
+            list: Re-ranked results per query, in input order.
+        """
+        pairs = [
+            (query, candidate["id"], candidate["contents"])
+            for query, candidates in zip(queries, candidate_lists)
+            for candidate in candidates
+        ]
+        scores = self._scores(pairs)
+
+        results = []
+        offset = 0
+        for candidates in candidate_lists:
+            results.append(self._ranked(candidates, scores[offset:offset + len(candidates)], top_k))
+            offset += len(candidates)
+        return results
+
+
+def _load_reranker(model_name=RERANK_MODEL, cache_size=4096, batch_size=64, early_exit_score=None):
+    # Imported here so importing this module does not pull in sentence_transformers and torch
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, device="cpu")
+    return CrossEncoderReranker(model, cache_size=cache_size, batch_size=batch_size, early_exit_score=early_exit_score)
+
+registry.register("reranker", _load_reranker)
+
+def get_reranker(**kwargs):
+    """
+    Return the shared cross-encoder reranker, loading it on first use.
+
+    Args:
+        **kwargs: Used on first load only: model_name, cache_size, batch_size, early_exit_score.
+
+    Returns:
+        CrossEncoderReranker: The reranker.
+    """
+    return registry.get("reranker", **kwargs)
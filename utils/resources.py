@@ -0,0 +1,95 @@
+import threading
+import time
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of heavy resources (embedder, index, chunk store, generators).
+
+    Each resource is registered with a loader and is loaded lazily, exactly once, on first use,
+    even when several threads ask for it at the same time. Entry points share the registry, so a
+    process only pays for the models it actually uses.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._resources = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.load_times = {}
+
+    def register(self, name, loader):
+        """
+        Register a loader. Registering a name again replaces a loader that has not run yet.
+
+        Args:
+            name (str): Resource name.
+            loader (function): Builds the resource; receives the keyword arguments of the first `get`.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name, **kwargs):
+        """
+        Return a resource, loading it on first use.
+
+        Args:
+            name (str): Resource name.
+            **kwargs: Passed to the loader on first load only (e.g. a file path).
+
+        Returns:
+            object: The resource.
+        """
+        if name in self._resources:
+            return self._resources[name]
+        if name not in self._loaders:
+            raise KeyError(f"No resource registered under '{name}'.")
+
+        with self._locks[name]:
+            if name not in self._resources:
+                start = time.perf_counter()
+                resource = self._loaders[name](**kwargs)
+                self.load_times[name] = time.perf_counter() - start
+                self._resources[name] = resource
+                print(f"Loaded {name} in {self.load_times[name]:.2f}s")
+        return self._resources[name]
+
+    def is_loaded(self, name):
+        return name in self._resources
+
+    def warm_up(self, names, background=True):
+        """
+        Load resources ahead of the first request.
+
+        Args:
+            names (list): Resource names, loaded in order.
+            background (bool): Load on a daemon thread and return immediately.
+
+        Returns:
+            threading.Thread or None: The warm-up thread when running in the background.
+        """
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as error:
+                    # Leave it unloaded; the first real `get` retries and raises to its caller
+                    print(f"Warm-up of {name} failed: {error}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="resource-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        """
+        Returns:
+            dict: Load time in seconds of every resource loaded so far.
+        """
+        return dict(self.load_times)
+
+
+registry = ResourceRegistry()
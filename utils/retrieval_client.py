@@ -0,0 +1,62 @@
+import json
+import urllib.error
+import urllib.request
+
+
+class RetrievalClient:
+    """
+    Client for `service.py`, with the same call shapes as the in-process retrieval functions.
+
+    Only the standard library is imported, so a process that retrieves through the service never
+    loads FAISS, the chunk store or the embedding model.
+    """
+
+    def __init__(self, base_url="http://127.0.0.1:8010", timeout=30.0):
+        """
+        Args:
+            base_url (str): Address of the retrieval service.
+            timeout (float): Seconds to wait for a response.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            detail = error.read().decode("utf-8", errors="replace")
+            raise RuntimeError(f"Retrieval service returned {error.code}: {detail}") from error
+
+    def retrieve(self, query, top_k=5, **options):
+        """
+        Retrieve passages for one query, like `retrieve_passages_with_keywords`.
+
+        Args:
+            query (str): The user query.
+            top_k (int): Number of top results to return.
+            **options: Passed to `retrieve_batch` in the service (hybrid, rerank, candidate_pool, ...).
+
+        Returns:
+            list: Retrieved passages.
+        """
+        return self._post("/retrieve", {"query": query, "top_k": top_k, **options})["results"]
+
+    def retrieve_batch(self, queries, top_k=5, **options):
+        """
+        Retrieve passages for many queries in one request, like `retrieve_batch`.
+
+        Returns:
+            list: One list of retrieved passages per query, in input order.
+        """
+        return self._post("/retrieve_batch", {"queries": list(queries), "top_k": top_k, **options})["results"]
+
+    def health(self):
+        with urllib.request.urlopen(self.base_url + "/health", timeout=self.timeout) as response:
+            return json.loads(response.read())
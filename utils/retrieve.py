@@ -1,93 +1,463 @@
 import numpy as np
 import faiss
 import json
-from sentence_transformers import SentenceTransformer
-import re
 import os
+from concurrent.futures import ThreadPoolExecutor
+from utils.bm25 import BM25Index
+from utils.line_locator import LineLocator, extract_quotation
+from utils.line_index import LineIndex
+from utils.keyword_matcher import KeywordMatcher
+from utils.chunk_store import ChunkStore, build_chunk_store
+from utils.filtered_search import FilteredIndex
+from utils.quantized_store import QuantizedIndex
+from utils.cache import QueryEmbeddingCache
+from utils.indexing import configure_index, normalize_embeddings, load_index_manifest
+from utils.rerank import get_reranker
+from utils.resources import registry
+from utils import metrics
 
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
-_chunks_with_metadata = None
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
-def load_chunks_with_metadata(file_path="data/all_chunks_400w40o_with_metadata.json"):
+_query_cache = None
+# Runs lexical scoring alongside the dense search; FAISS releases the GIL while searching
+_lexical_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bm25")
+
+def _load_embedder(model_name=EMBEDDING_MODEL):
+    # Imported here so processes that never embed anything do not pay for importing torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def get_embedder():
+    """
+    Return the shared SentenceTransformer, loading it on first use.
+
+    Returns:
+        SentenceTransformer: The embedding model.
+    """
+    return registry.get("embedder")
+
+def configure_query_cache(max_size=1024, db_path=None):
     """
-    Load chunks with metadata from a JSON file. Use a global variable to avoid reloading.
+    (Re)create the query-embedding cache that sits in front of `embedder.encode`.
 
     Args:
-        file_path (str): Path to the JSON file.
+        max_size (int): Maximum number of query embeddings kept in memory.
+        db_path (str): Optional SQLite file so the cache survives restarts.
 
     Returns:
-        list: List of chunks with metadata.
+        QueryEmbeddingCache: The new cache.
+    """
+    global _query_cache
+
+    _query_cache = QueryEmbeddingCache(
+        lambda queries: get_embedder().encode(queries, convert_to_numpy=True),
+        model_name=EMBEDDING_MODEL,
+        max_size=max_size,
+        db_path=db_path
+    )
+    return _query_cache
+
+@metrics.traced("encode_queries")
+def encode_queries(queries):
     """
-    global _chunks_with_metadata
+    Embed queries through the query-embedding cache.
 
-    if _chunks_with_metadata is None:
+    Args:
+        queries (list): Query strings.
+
+    Returns:
+        np.ndarray: L2-normalized query embeddings of shape (len(queries), dimension). Against a
+        normalized index the search scores are then cosine similarities.
+    """
+    if _query_cache is None:
+        configure_query_cache()
+    return normalize_embeddings(_query_cache.encode(queries))
+
+def _load_chunks(file_path="data/all_chunks_400w40o_with_metadata.json", store_dir="data/chunk_store_400w40o"):
+    if not os.path.exists(os.path.join(store_dir, "meta.json")):
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         with open(file_path, "r", encoding="utf-8") as file:
-            _chunks_with_metadata = json.load(file)
-    return _chunks_with_metadata
+            build_chunk_store(json.load(file), store_dir)
+        print(f"Chunk store saved to {store_dir}")
+    return ChunkStore(store_dir)
 
-def retrieve_passages(query, top_k=5, filter_title=None, filter_genre=None):
+def load_chunks_with_metadata(file_path="data/all_chunks_400w40o_with_metadata.json", store_dir="data/chunk_store_400w40o"):
     """
-    Retrieve passages based on the query, with optional metadata filtering by title and genre.
+    Load chunks with metadata from the compact chunk store, once per process.
+
+    The first call converts the JSON metadata file into the store if the store does not exist yet.
 
     Args:
-        query (str): The user query.
-        top_k (int): Number of top results to return.
-        filter_title (str): Optional title to filter chunks by (e.g., "Hamlet").
-        filter_genre (str): Optional genre to filter chunks by (e.g., "Sonnet", "Poem", "Play").
+        file_path (str): Path to the JSON file.
+        store_dir (str): Directory of the compact chunk store.
+
+    Returns:
+        ChunkStore: Sequence of chunks with metadata; contents are read lazily from a memory-mapped file.
+    """
+    return registry.get("chunks", file_path=file_path, store_dir=store_dir)
+
+def _load_index(file_path="data/faiss_index_400w40o.bin", mmap=False):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    if mmap:
+        # IO_FLAG_MMAP_IFC maps the vector storage of every index type; combined with IO_FLAG_MMAP
+        # it fails for IVF indexes. Older FAISS versions only have IO_FLAG_MMAP, which maps nothing
+        # for flat and HNSW indexes.
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            return faiss.read_index(file_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        return faiss.read_index(file_path, faiss.IO_FLAG_MMAP)
+    return faiss.read_index(file_path)
+
+def load_index(file_path="data/faiss_index_400w40o.bin", nprobe=None, ef_search=None, mmap=False):
+    """
+    Load the prebuilt FAISS index, once per process.
+
+    Args:
+        file_path (str): Path to the FAISS index file.
+        nprobe (int): IVF lists visited per query (IVF and IVF-PQ indexes only).
+        ef_search (int): HNSW search beam width (HNSW indexes only).
+        mmap (bool): Memory-map the index read-only instead of reading it into memory, so processes
+            sharing the file share its pages. Needs a FAISS build with IO_FLAG_MMAP_IFC; the pinned
+            faiss-cpu 1.7.4 still reads flat and HNSW indexes into memory. Used on first load only.
+
+    Returns:
+        faiss.Index: The loaded index.
+    """
+    # Read the manifest of the same file, for the min_score check
+    registry.get("index_manifest", file_path=file_path)
+    return configure_index(
+        registry.get("index", file_path=file_path, mmap=mmap), nprobe=nprobe, ef_search=ef_search
+    )
+
+def load_filtered_index():
+    """
+    Wrap the prebuilt index and chunk metadata in a FilteredIndex, once per process.
+
+    Returns:
+        FilteredIndex: Searcher supporting title and genre filters over the prebuilt index.
+    """
+    return registry.get("filtered_index")
+
+def use_quantized_index(store_dir="data/quantized_400w40o", code_type="int8", rescore_k=100):
+    """
+    Serve dense search from compact codes with exact rescoring instead of the float32 FAISS index.
+
+    Must be called before the filtered index is first loaded.
+
+    Args:
+        store_dir (str): Directory written by `build_quantized_store`.
+        code_type (str): "int8", "float16" or "binary".
+        rescore_k (int): Candidates per query rescored from the memory-mapped float32 file.
+    """
+    if registry.is_loaded("filtered_index"):
+        raise RuntimeError("The filtered index is already loaded; call use_quantized_index first.")
+    registry.register("filtered_index", lambda: FilteredIndex(
+        QuantizedIndex(store_dir, code_type=code_type, rescore_k=rescore_k), load_chunks_with_metadata()
+    ))
+
+def load_bm25_index():
+    """
+    Build the BM25 inverted index over chunk contents, once per process.
+
+    Returns:
+        BM25Index: Lexical index in the same order as the chunks.
+    """
+    return registry.get("bm25_index")
+
+def _load_line_locator(file_path="data/books_with_sonnets.json"):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r", encoding="utf-8") as file:
+        return LineLocator(json.load(file))
+
+def load_line_locator(file_path="data/books_with_sonnets.json"):
+    """
+    Build the exact-phrase line locator from the books parsed by `parsing.py`, once per process.
+
+    Args:
+        file_path (str): Path to the parsed books JSON file.
+
+    Returns:
+        LineLocator or None: The locator, or None when the parsed books are not available.
+    """
+    return registry.get("line_locator", file_path=file_path)
+
+def _load_line_index(store_dir="data/line_index_400w40o"):
+    if not os.path.exists(os.path.join(store_dir, "meta.json")):
+        return None
+    line_index = LineIndex(store_dir)
+    if line_index.chunk_ids != load_chunks_with_metadata().ids:
+        raise ValueError(f"Line index in {store_dir} was built for different chunks; rebuild it.")
+    return line_index
+
+def load_line_index(store_dir="data/line_index_400w40o"):
+    """
+    Load the line-level index used by `retrieve_lines`, once per process.
+
+    Args:
+        store_dir (str): Directory written by `utils.line_index.build_line_index`.
+
+    Returns:
+        LineIndex or None: The line index, or None when it has not been built.
+    """
+    return registry.get("line_index", store_dir=store_dir)
+
+def chunk_position(chunk_id):
+    """
+    Look up the position of a chunk in the index by its ID.
+
+    Args:
+        chunk_id (str): Chunk ID, e.g. "book_7_chunk_37".
+
+    Returns:
+        int or None: Position of the chunk, or None if it is unknown.
+    """
+    return registry.get("chunk_positions").get(chunk_id)
+
+registry.register("embedder", _load_embedder)
+registry.register("chunks", _load_chunks)
+registry.register("index", _load_index)
+registry.register("index_manifest", lambda file_path="data/faiss_index_400w40o.bin": load_index_manifest(file_path))
+registry.register("filtered_index", lambda: FilteredIndex(load_index(), load_chunks_with_metadata()))
+registry.register("bm25_index", lambda: BM25Index(chunk["contents"] for chunk in load_chunks_with_metadata()))
+registry.register("line_locator", _load_line_locator)
+registry.register("line_index", _load_line_index)
+registry.register("chunk_positions", lambda: {
+    chunk_id: position for position, chunk_id in enumerate(load_chunks_with_metadata().ids)
+})
+
+# Everything a retrieval-only process needs, in dependency order. The FAISS index is loaded through
+# the filtered index, unless `use_quantized_index` has replaced it and it is not needed at all.
+RETRIEVAL_RESOURCES = ["embedder", "chunks", "filtered_index", "bm25_index", "line_locator", "keyword_matcher"]
+
+def _check_min_score(min_score):
+    # Raw dot products of an index built from unnormalized vectors have no fixed scale to cut at
+    if min_score is None:
+        return
+    manifest = registry.get("index_manifest")
+    if not manifest or not manifest.get("normalized"):
+        raise ValueError("min_score needs an index built from normalized vectors; rebuild it with process.py.")
+
+def _cut_below(positions, scores, min_score):
+    # Dense results come back best first, so the cutoff keeps a prefix
+    if min_score is None:
+        return positions, scores
+    keep = int(np.count_nonzero(np.asarray(scores) >= min_score))
+    metrics.increment("min_score_cutoff_total", len(scores) - keep)
+    return positions[:keep], scores[:keep]
+
+@metrics.traced("materialize")
+def format_results(positions, distances):
+    """
+    Materialize ranked chunk positions into result dicts.
+
+    Args:
+        positions (iterable): Chunk positions in rank order; -1 marks a missing result.
+        distances (iterable): Score for each position, or None when unavailable.
 
     Returns:
         list: Retrieved passages.
     """
     chunks_with_metadata = load_chunks_with_metadata()
-    filtered_chunks = chunks_with_metadata
-    
-    if filter_title:
-        filtered_chunks = [
-            chunk for chunk in filtered_chunks
-            if filter_title.lower() in chunk["metadata"]["title"].lower()
-        ]
-    if filter_genre:
-        filtered_chunks = [
-            chunk for chunk in filtered_chunks
-            if chunk["metadata"]["genre"].lower() == filter_genre.lower()
-        ]
-
-    if not filtered_chunks:
-        filtered_chunks = chunks_with_metadata
-        
-    query_embedding = embedder.encode([query], convert_to_numpy=True)
-    filtered_embeddings = np.array([
-        embedder.encode(chunk["contents"], convert_to_numpy=True)
-        for chunk in filtered_chunks
-    ])
-
-    # Create a temporary FAISS index for the filtered chunks
-    dimension = filtered_embeddings.shape[1]
-    temp_index = faiss.IndexFlatIP(dimension)
-    temp_index.add(filtered_embeddings)
-
-    distances, indices = temp_index.search(query_embedding, top_k)
 
-    # Retrieve the top results
     results = []
-    for i, idx in enumerate(indices[0]):
-        result = filtered_chunks[idx]
+    for i, (idx, distance) in enumerate(zip(positions, distances)):
+        if idx < 0:
+            break
+        result = chunks_with_metadata[idx]
         results.append({
             "rank": i + 1,
             "id": result["id"],
             "name": result["name"],
             "contents": result["contents"],
-            "distance": distances[0][i]
+            "distance": distance
         })
 
     return results
 
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+    Fuse several ranked lists of chunk positions with reciprocal rank fusion.
+
+    Args:
+        ranked_lists (list): Lists of chunk positions, best first.
+        k (int): RRF damping constant.
+
+    Returns:
+        list: (position, fused score) pairs, best first.
+    """
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, position in enumerate(ranked, start=1):
+            fused[position] = fused.get(position, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+@metrics.traced("retrieve_passages")
+def retrieve_passages(query, top_k=5, filter_title=None, filter_genre=None, min_score=None):
+    """
+    Retrieve passages based on the query, with optional metadata filtering by title and genre.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of top results to return.
+        filter_title (str or list): Optional title, or list of titles, to filter chunks by (e.g., "Hamlet").
+        filter_genre (str): Optional genre to filter chunks by (e.g., "Sonnet", "Poem", "Play").
+        min_score (float): Optional cosine similarity cutoff; weaker hits are dropped before their
+            text is read. Raises ValueError unless the index was built from normalized vectors.
+
+    Returns:
+        list: Retrieved passages, possibly fewer than `top_k`.
+    """
+    _check_min_score(min_score)
+    filtered_index = load_filtered_index()
+
+    # Searches the whole corpus when the filter matches nothing
+    query_embedding = encode_queries([query])
+    distances, indices = filtered_index.search(
+        query_embedding, top_k, filter_title=filter_title, filter_genre=filter_genre
+    )
+
+    # Retrieve the top results
+    return format_results(*_cut_below(indices[0], distances[0], min_score))
+
+@metrics.traced("retrieve_passages_hybrid")
+def retrieve_passages_hybrid(query, top_k=5, filter_title=None, filter_genre=None, candidate_k=20, rrf_k=60,
+                             min_score=None):
+    """
+    Retrieve passages by fusing dense FAISS search with BM25 lexical search.
+
+    Both searches run concurrently over the same filtered candidate set and their ranked lists
+    are merged with reciprocal rank fusion, which lets exact-quote queries surface chunks that
+    the embedding model ranks low.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of top results to return.
+        filter_title (str or list): Optional title(s) to filter chunks by.
+        filter_genre (str): Optional genre to filter chunks by.
+        candidate_k (int): Number of candidates taken from each ranked list before fusion.
+        rrf_k (int): RRF damping constant.
+        min_score (float): Optional cosine similarity cutoff. Only hits the dense search scored at
+            or above it are kept, so lexical-only hits, whose similarity is unknown, are dropped.
+
+    Returns:
+        list: Retrieved passages. "distance" is the dense score, or None for lexical-only hits;
+        "score" is the fused RRF score.
+    """
+    _check_min_score(min_score)
+    filtered_index = load_filtered_index()
+    bm25_index = load_bm25_index()
+    candidate_k = max(candidate_k, top_k)
+
+    allowed_ids = filtered_index.filter_ids(filter_title, filter_genre)
+    lexical = _lexical_executor.submit(bm25_index.search, query, candidate_k, allowed_ids)
+
+    query_embedding = encode_queries([query])
+    distances, indices = filtered_index.search(
+        query_embedding, candidate_k, filter_title=filter_title, filter_genre=filter_genre
+    )
+    _, lexical_ranked = lexical.result()
+
+    return _fuse_results(indices[0], distances[0], lexical_ranked, top_k, rrf_k, min_score)
+
+def _fuse_results(dense_indices, dense_distances, lexical_ranked, top_k, rrf_k, min_score=None):
+    dense_ranked = [int(idx) for idx in dense_indices if idx >= 0]
+    dense_scores = {int(idx): distance for idx, distance in zip(dense_indices, dense_distances) if idx >= 0}
+
+    fused = reciprocal_rank_fusion([dense_ranked, [int(idx) for idx in lexical_ranked]], k=rrf_k)
+    if min_score is not None:
+        # Cut before materializing: lexical-only hits have no similarity to compare
+        kept = [(position, score) for position, score in fused
+                if dense_scores.get(position) is not None and dense_scores[position] >= min_score]
+        metrics.increment("min_score_cutoff_total", len(fused) - len(kept))
+        fused = kept
+    fused = fused[:top_k]
+    results = format_results(
+        [position for position, _ in fused],
+        [dense_scores.get(position) for position, _ in fused]
+    )
+    for result, (_, score) in zip(results, fused):
+        result["score"] = score
+    return results
+
+@metrics.traced("retrieve_lines")
+def retrieve_lines(query, top_k=5, top_n_chunks=5, filter_title=None, filter_genre=None, min_score=None):
+    """
+    Two-level retrieval: search the chunk index, then the lines of the best chunks only.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of line spans to return.
+        top_n_chunks (int): Number of chunks whose lines are scored.
+        filter_title (str or list): Optional title(s) to filter chunks by.
+        filter_genre (str): Optional genre to filter chunks by.
+        min_score (float): Optional cosine similarity cutoff for the chunks whose lines are scored.
+
+    Returns:
+        list: Passages holding the best line spans, best first, with "line", "line_number",
+        "end_line_number", "title", "line_score" and "source": "line_index" set. Empty when the
+        line index has not been built.
+    """
+    _check_min_score(min_score)
+    line_index = load_line_index()
+    if line_index is None:
+        return []
+
+    query_embedding = encode_queries([query])
+    distances, indices = load_filtered_index().search(
+        query_embedding, top_n_chunks, filter_title=filter_title, filter_genre=filter_genre
+    )
+    return _line_results(line_index, query_embedding[0], indices[0], distances[0], top_k, min_score)
+
+def _line_results(line_index, query_embedding, chunk_indices, chunk_distances, top_k, min_score=None):
+    # Score the lines of the coarse search's chunks and materialize the best spans
+    positions, _ = _cut_below(chunk_indices, chunk_distances, min_score)
+    with metrics.span("line_search"):
+        spans = line_index.search(query_embedding, positions, top_k=top_k)
+
+    chunk_distances = {int(idx): distance for idx, distance in zip(chunk_indices, chunk_distances)}
+    results = format_results(
+        [span["chunk_position"] for span in spans], [chunk_distances[span["chunk_position"]] for span in spans]
+    )
+    for result, span in zip(results, spans):
+        result.update({
+            "title": span["book_name"],
+            "line": span["line"],
+            "line_number": span["line_number"],
+            "end_line_number": span["end_line_number"],
+            "line_score": span["score"],
+            "source": "line_index"
+        })
+    return results
+
 # Predefined lists of names and genres
 names_list = ["all's well that ends well", "antony and cleopatra", "as you like it", "comedy of errors", "coriolanus", "cymbeline", "hamlet", "henry iv", "henry v", "henry vi", "henry viii", "king john", "julius caesar", "king lear", "love's labour's lost", "macbeth", "measure for measure", "the merchant of venice", "the merry wives of windsor", "a midsummer night's dream", "much ado about nothing", "othello", "pericles, prince of tyre", "richard ii", "richard iii", "romeo and juliet", "the taming of the shrew", "titus andronicus", "trolius and cressida", "twelfth night", "the two gentlemen of verona", "the two noble kinsmen", "the winter's tale", "a lover's complaint", "the passionate pilgrim", "the phoenix and the turtle", "the rape of lucrece", "venus and adonis", "sonnet"]
 genres_list = ["Sonnet", "Poem", "Play"]
 
+def _load_keyword_matcher(contents_path="data/parsed_contents.json"):
+    titles = set(load_chunks_with_metadata().titles)
+    if os.path.exists(contents_path):
+        with open(contents_path, "r", encoding="utf-8") as file:
+            titles.update(entry["name"] for entry in json.load(file))
+    return KeywordMatcher(titles, extra_aliases=names_list)
+
+def load_keyword_matcher(contents_path="data/parsed_contents.json"):
+    """
+    Compile the title/genre matcher from the chunk titles, the parsed contents list (when available)
+    and `names_list`, once per process.
+
+    Args:
+        contents_path (str): Path to the contents list saved by `parsing.py`.
+
+    Returns:
+        KeywordMatcher: The compiled matcher.
+    """
+    return registry.get("keyword_matcher", contents_path=contents_path)
+
+registry.register("keyword_matcher", _load_keyword_matcher)
+
+@metrics.traced("extract_keywords")
 def extract_keywords(query):
     """
     Extract keywords for names and genres from the query.
@@ -96,45 +466,224 @@ def extract_keywords(query):
         query (str): The user query.
 
     Returns:
-        dict: A dictionary with detected name and genre keywords.
+        dict: A dictionary with detected names (canonical titles, "Sonnet N" for numbered sonnets),
+        genres and sonnet numbers.
+    """
+    return load_keyword_matcher().match(query)
+
+@metrics.traced("locate_quotation")
+def locate_quotation(query, top_k=5, filter_title=None, filter_genre=None):
     """
-    query_lower = query.lower()
-    detected_names = []
-    detected_genres = []
+    Answer "which work contains this line" queries by string lookup instead of embedding search.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Maximum number of results to return.
+        filter_title (str or list): Optional title(s); matching chunks are ranked first.
+        filter_genre (str): Optional genre; matching chunks are ranked first.
 
-    for name in names_list:
-        if name.lower() == "sonnet":
-            # Check if "sonnet" is followed by a number
-            if re.search(r"sonnet\s*\d+", query_lower):
-                detected_names.append(re.search(r"sonnet\s+\d+", query_lower).group())
-        elif name.lower() in query_lower:
-            detected_names.append(name)
+    Returns:
+        list: Passages containing the quoted phrase, with "line", "line_number", "title" and
+        "source" set, or an empty list when the query quotes nothing locatable.
+    """
+    quotation = extract_quotation(query)
+    if not quotation:
+        return []
+    line_locator = load_line_locator()
+    if line_locator is None:
+        return []
 
-    for genre in genres_list:
-        if genre.lower() == "sonnet":
-            if "sonnet" in query_lower and not re.search(r"sonnet\s+\d+", query_lower):
-                detected_genres.append("Sonnet")
-        elif genre.lower() in query_lower:
-            detected_genres.append(genre)
+    # Structured chunks are found by their line range; word-window chunks by the locator's ID guess
+    chunks = load_chunks_with_metadata()
+    matches = []
+    for match in line_locator.locate(quotation, max_results=top_k):
+        position = chunks.position_for_line(match["book_id"], match["line_number"])
+        matches.append((match, chunk_position(match["chunk_id"]) if position is None else position))
+    matches = [(match, position) for match, position in matches if position is not None]
+    if not matches:
+        return []
 
-    return {
-        "names": detected_names,
-        "genres": detected_genres
-    }
+    # Prefer occurrences inside the detected title/genre, e.g. the sonnet when asked "which sonnet"
+    allowed_ids = load_filtered_index().filter_ids(filter_title, filter_genre)
+    allowed = set() if allowed_ids is None else set(allowed_ids.tolist())
+    matches.sort(key=lambda item: (bool(allowed) and item[1] not in allowed, -item[0]["score"]))
 
-def retrieve_passages_with_keywords(query, top_k=5):
+    results = format_results([position for _, position in matches], [match["score"] for match, _ in matches])
+    for result, (match, _) in zip(results, matches):
+        result.update({
+            "title": match["book_name"],
+            "line": match["line"],
+            "line_number": match["line_number"],
+            "quotation": quotation,
+            "source": "line_locator"
+        })
+    return results
+
+def _keyword_filters(query):
+    keywords = extract_keywords(query)
+    filter_title = keywords["names"] or None
+    filter_genre = keywords["genres"][0] if keywords["genres"] else None
+    return filter_title, filter_genre
+
+@metrics.traced("retrieve")
+def retrieve_passages_with_keywords(query, top_k=5, hybrid=True, rerank=False, candidate_pool=50, min_score=None,
+                                    top_n_chunks=5):
     """
     Retrieve passages based on the query, automatically detecting names and genres.
 
     Args:
         query (str): The user query.
         top_k (int): Number of top results to return.
+        hybrid (bool): Fuse BM25 lexical results with the dense results.
+        rerank (bool): Re-rank a larger candidate pool with the cross-encoder (see `utils.rerank`).
+        candidate_pool (int): Number of first-stage candidates passed to the reranker.
+        min_score (float): Optional cosine similarity cutoff for embedding hits (see `retrieve_passages_hybrid`);
+            located quotations are string matches and are kept.
+        top_n_chunks (int): Chunks whose lines are scored for quotations not found verbatim (see `retrieve_lines`).
 
     Returns:
-        list: Retrieved passages.
+        list: Retrieved passages. Queries quoting a line that is found verbatim return the
+        passages containing it, marked with "source": "line_locator"; other quotations return
+        the closest lines from the line index when it is built ("source": "line_index").
     """
-    keywords = extract_keywords(query)
-    filter_title = keywords["names"][0] if keywords["names"] else None
-    filter_genre = keywords["genres"][0] if keywords["genres"] else None
+    _check_min_score(min_score)
+    filter_title, filter_genre = _keyword_filters(query)
+
+    # Quoted lines are a string lookup; skip the embedding model when the phrase is found
+    results = locate_quotation(query, top_k=top_k, filter_title=filter_title, filter_genre=filter_genre)
+    if results:
+        return results
+    # A quotation not found verbatim (misremembered wording): find the closest lines instead
+    if extract_quotation(query):
+        results = retrieve_lines(
+            query, top_k=top_k, top_n_chunks=top_n_chunks, filter_title=filter_title, filter_genre=filter_genre,
+            min_score=min_score
+        )
+        if results:
+            return results
+
+    search_k = max(candidate_pool, top_k) if rerank else top_k
+    if hybrid:
+        results = retrieve_passages_hybrid(
+            query, top_k=search_k, filter_title=filter_title, filter_genre=filter_genre, candidate_k=max(20, search_k),
+            min_score=min_score
+        )
+    else:
+        results = retrieve_passages(
+            query, top_k=search_k, filter_title=filter_title, filter_genre=filter_genre, min_score=min_score
+        )
 
-    return retrieve_passages(query, top_k=top_k, filter_title=filter_title, filter_genre=filter_genre)
+    if rerank:
+        return get_reranker().rerank(query, results, top_k=top_k)
+    return results
+
+
+@metrics.traced("retrieve_batch")
+def retrieve_batch(queries, top_k=5, hybrid=True, candidate_k=20, rrf_k=60, rerank=False, candidate_pool=50,
+                   min_score=None, top_n_chunks=5):
+    """
+    Retrieve passages for many queries at once; the batched counterpart of `retrieve_passages_with_keywords`.
+
+    Quoted lines are resolved by the line locator first. The remaining queries are encoded in one
+    batched call, grouped by their detected title/genre filter, and each group is searched with a
+    single `index.search` over a matrix of queries. BM25 scoring runs on worker threads meanwhile.
+    Quotations not found verbatim get the closest lines from the line index, as in
+    `retrieve_passages_with_keywords`, with one chunk search per filter group.
+
+    Args:
+        queries (list): Query strings.
+        top_k (int): Number of top results per query.
+        hybrid (bool): Fuse BM25 lexical results with the dense results.
+        candidate_k (int): Candidates taken from each ranked list before fusion (hybrid only).
+        rrf_k (int): RRF damping constant (hybrid only).
+        rerank (bool): Re-rank a larger candidate pool with the cross-encoder, in one batched pass.
+        candidate_pool (int): Number of first-stage candidates per query passed to the reranker.
+        min_score (float): Optional cosine similarity cutoff for embedding hits.
+        top_n_chunks (int): Chunks whose lines are scored for quotations not found verbatim (see `retrieve_lines`).
+
+    Returns:
+        list: One list of retrieved passages per query, in input order.
+    """
+    _check_min_score(min_score)
+    filtered_index = load_filtered_index()
+    # Candidates kept from the first stage; the reranker cuts them back to top_k
+    first_stage_k = max(candidate_pool, top_k) if rerank else top_k
+    results = [None] * len(queries)
+
+    groups = {}
+    for i, query in enumerate(queries):
+        filter_title, filter_genre = _keyword_filters(query)
+        located = locate_quotation(query, top_k=top_k, filter_title=filter_title, filter_genre=filter_genre)
+        if located:
+            results[i] = located
+            continue
+        title_key = tuple(filter_title) if filter_title else None
+        groups.setdefault((title_key, filter_genre), []).append(i)
+
+    pending = [i for members in groups.values() for i in members]
+    if not pending:
+        return results
+
+    # Misquoted lines: the line index answers them, when it is built
+    quoted = {i for i in pending if extract_quotation(queries[i])}
+    line_index = load_line_index() if quoted else None
+    if line_index is None:
+        quoted = set()
+
+    search_k = max(candidate_k, first_stage_k) if hybrid else first_stage_k
+    bm25_index = load_bm25_index() if hybrid else None
+    lexical = {}
+
+    def submit_lexical(members, title_key, filter_genre):
+        allowed_ids = filtered_index.filter_ids(list(title_key) if title_key else None, filter_genre)
+        for i in members:
+            lexical[i] = _lexical_executor.submit(bm25_index.search, queries[i], search_k, allowed_ids)
+
+    if hybrid:
+        for (title_key, filter_genre), members in groups.items():
+            submit_lexical([i for i in members if i not in quoted], title_key, filter_genre)
+
+    embeddings = encode_queries([queries[i] for i in pending])
+    rows = {i: row for row, i in enumerate(pending)}
+
+    if quoted:
+        for (title_key, filter_genre), members in groups.items():
+            quoted_members = [i for i in members if i in quoted]
+            if not quoted_members:
+                continue
+            distances, indices = filtered_index.search(
+                embeddings[[rows[i] for i in quoted_members]], top_n_chunks,
+                filter_title=list(title_key) if title_key else None, filter_genre=filter_genre
+            )
+            for row, i in enumerate(quoted_members):
+                results[i] = _line_results(
+                    line_index, embeddings[rows[i]], indices[row], distances[row], top_k, min_score
+                ) or None
+
+        # Only queries the line index could not answer go on to the passage search
+        groups = {key: [i for i in members if results[i] is None] for key, members in groups.items()}
+        groups = {key: members for key, members in groups.items() if members}
+        pending = [i for members in groups.values() for i in members]
+        if hybrid:
+            for (title_key, filter_genre), members in groups.items():
+                submit_lexical([i for i in members if i not in lexical], title_key, filter_genre)
+
+    for (title_key, filter_genre), members in groups.items():
+        distances, indices = filtered_index.search(
+            embeddings[[rows[i] for i in members]], search_k,
+            filter_title=list(title_key) if title_key else None, filter_genre=filter_genre
+        )
+        for row, i in enumerate(members):
+            if hybrid:
+                _, lexical_ranked = lexical[i].result()
+                results[i] = _fuse_results(
+                    indices[row], distances[row], lexical_ranked, first_stage_k, rrf_k, min_score
+                )
+            else:
+                results[i] = format_results(*_cut_below(indices[row], distances[row], min_score))
+
+    if rerank and pending:
+        reranked = get_reranker().rerank_batch([queries[i] for i in pending], [results[i] for i in pending], top_k=top_k)
+        for i, reranked_results in zip(pending, reranked):
+            results[i] = reranked_results
+    return results